@@ -0,0 +1,77 @@
+"""
+End-to-end check of the mock-task-3 eval runner: starts the fake proxy
+in-process, runs arun_evals on the built-in cases (generation and judging
+both go through litellm to the fake proxy) and fails unless every cell
+was judged and got a Y/N score.
+
+    python eval_check.py
+    python eval_check.py --models gpt-4o-mini gpt-4.1-mini --dataset sample.jsonl
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+
+import uvicorn
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+import fake_llm  # noqa: E402
+
+
+def start_fake_proxy(port: int) -> uvicorn.Server:
+    args = fake_llm.parse_args(["--port", str(port), "--latency", "fixed:0.01", "--completion-tokens", "20"])
+    server = uvicorn.Server(uvicorn.Config(fake_llm.create_app(fake_llm.Config(args)), host="127.0.0.1",
+                                           port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("fake proxy did not start")
+        time.sleep(0.05)
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o-mini"])
+    parser.add_argument("--dataset", help="JSONL file in mock-task-3/backend/datasets/ (built-in cases by default)")
+    args = parser.parse_args(argv)
+
+    port = free_port()
+    server = start_fake_proxy(port)
+    # the eval modules read these at import time; keep their cache files out of the tree
+    os.environ["LITELLM_API_BASE"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("LITELLM_API_KEY", "sk-fake")
+    os.chdir(tempfile.mkdtemp(prefix="eval-check-"))
+    os.environ["EVAL_RUNS_DIR"] = os.path.join(os.getcwd(), "evals")
+    sys.path.insert(0, os.path.join(ROOT, "mock-task-3", "backend"))
+    import evals
+
+    try:
+        out = asyncio.run(evals.arun_evals(args.models, args.dataset))
+    finally:
+        server.should_exit = True
+    failed = [r for r in out["results"]
+              if r.get("error") or not isinstance(r.get("score"), dict) or r["score"].get("score") not in (0, 1)]
+    for r in out["results"]:
+        verdict = r.get("error") or f"score={r['score'].get('score')} ({r['score'].get('value')})"
+        print(f"{r['model']:<16} {r['case_id']:<18} {verdict}")
+    print(json.dumps({"run_id": out["run_id"], "stats": out["stats"], "failed": len(failed)}))
+    return 1 if failed or not out["results"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
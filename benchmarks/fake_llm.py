@@ -0,0 +1,203 @@
+"""
+Stand-in for the LiteLLM proxy: an OpenAI-compatible server with
+configurable latency, error rates and streaming, plus a numbersapi
+stand-in, so the backends can be load-tested without a real provider.
+
+    python fake_llm.py --port 4000 --latency lognormal:0.8,0.5 --error-rate 0.02 \
+        --model-latency gpt-4o-mini=fixed:0.3
+
+Point the backends at it with LITELLM_API_BASE=http://localhost:4000 and
+NUMBERS_API_BASE=http://localhost:4000, and use OpenAI-style model names
+(litellm speaks the OpenAI protocol to a custom api_base for those).
+"""
+import os
+import sys
+import json
+import time
+import math
+import re
+import random
+import asyncio
+import hashlib
+import argparse
+from typing import Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+
+class Latency:
+    """A latency distribution parsed from "fixed:S", "uniform:LO,HI" or "lognormal:MEDIAN,SIGMA" (seconds)."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(*values)
+        elif kind == "lognormal" and len(values) == 2:
+            mu, sigma = math.log(values[0]), values[1]
+            self._sample = lambda: random.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"bad latency spec {spec!r}")
+
+    def sample(self) -> float:
+        return max(0.0, self._sample())
+
+
+class Config:
+    def __init__(self, args):
+        self.latency = Latency(args.latency)
+        self.model_latency: Dict[str, Latency] = {}
+        for item in args.model_latency:
+            model, _, spec = item.partition("=")
+            self.model_latency[model] = Latency(spec)
+        self.embed_latency = Latency(args.embed_latency)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.tokens_per_s = args.tokens_per_s
+        self.completion_tokens = args.completion_tokens
+        self.embed_dim = args.embed_dim
+
+    def latency_for(self, model: str) -> float:
+        return self.model_latency.get(model, self.latency).sample()
+
+
+def parse_args(argv=None):
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=env("FAKE_LLM_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(env("FAKE_LLM_PORT", "4000")))
+    parser.add_argument("--latency", default=env("FAKE_LLM_LATENCY", "lognormal:0.8,0.5"),
+                        help="completion latency (time to first token when streaming)")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="per-model latency override; repeatable")
+    parser.add_argument("--embed-latency", default=env("FAKE_LLM_EMBED_LATENCY", "fixed:0.05"))
+    parser.add_argument("--error-rate", type=float, default=float(env("FAKE_LLM_ERROR_RATE", "0")),
+                        help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=float(env("FAKE_LLM_RATE_LIMIT_RATE", "0")),
+                        help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--tokens-per-s", type=float, default=float(env("FAKE_LLM_TOKENS_PER_S", "80")),
+                        help="streaming speed after the first token")
+    parser.add_argument("--completion-tokens", type=int, default=int(env("FAKE_LLM_COMPLETION_TOKENS", "60")))
+    parser.add_argument("--embed-dim", type=int, default=int(env("FAKE_LLM_EMBED_DIM", "1536")))
+    return parser.parse_args(argv)
+
+
+def _words(seed: str, n: int):
+    vocab = ("the", "schedule", "milestone", "risk", "delay", "crane", "pour", "slab", "permit", "weather",
+             "critical", "path", "float", "handover", "steel", "frame", "inspection", "week", "likely", "low")
+    rnd = random.Random(seed)
+    return [rnd.choice(vocab) for _ in range(n)]
+
+
+# judge prompts (e.g. mock-task-3's evaluator) ask for a Y/N verdict on the last line
+_VERDICT_RE = re.compile(r"\(Y or N\)")
+
+
+def _prompt_text(body: dict) -> str:
+    return "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+
+
+def create_app(cfg: Config) -> FastAPI:
+    app = FastAPI(title="Fake LiteLLM")
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0, "streams": 0}
+
+    def injected_error():
+        r = random.random()
+        if r < cfg.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse({"error": {"message": "rate limited (fake)", "type": "rate_limit_error"}},
+                                status_code=429)
+        if r < cfg.rate_limit_rate + cfg.error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "upstream error (fake)", "type": "server_error"}},
+                                status_code=500)
+        return None
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        model = body.get("model", "fake")
+        delay = cfg.latency_for(model)
+        error = injected_error()
+        if error is not None:
+            await asyncio.sleep(delay / 4)
+            return error
+        prompt = _prompt_text(body)
+        words = _words(model + prompt, cfg.completion_tokens)
+        if _VERDICT_RE.search(prompt):
+            words.append("\n" + random.Random(prompt).choice("YN"))
+        created = int(time.time())
+        rid = "chatcmpl-" + hashlib.sha1(f"{time.time_ns()}{prompt}".encode()).hexdigest()[:12]
+        usage = {"prompt_tokens": max(1, len(prompt) // 4), "completion_tokens": len(words),
+                 "total_tokens": max(1, len(prompt) // 4) + len(words)}
+
+        if body.get("stream"):
+            stats["streams"] += 1
+
+            async def events():
+                await asyncio.sleep(delay)
+                gap = 1.0 / cfg.tokens_per_s if cfg.tokens_per_s > 0 else 0
+                for i, word in enumerate(words):
+                    chunk = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                             "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                          "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    if gap:
+                        await asyncio.sleep(gap)
+                final = {"id": rid, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay)
+        return {"id": rid, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)},
+                             "finish_reason": "stop"}],
+                "usage": usage}
+
+    @app.post("/embeddings")
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        error = injected_error()
+        if error is not None:
+            return error
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        await asyncio.sleep(cfg.embed_latency.sample())
+        data = []
+        for i, text in enumerate(inputs):
+            rnd = random.Random(hashlib.sha256(str(text).encode()).hexdigest())
+            vec = [rnd.gauss(0, 1) for _ in range(cfg.embed_dim)]
+            norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+            data.append({"object": "embedding", "index": i, "embedding": [v / norm for v in vec]})
+        return {"object": "list", "data": data, "model": body.get("model", "fake-embedding"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    @app.get("/{n}/math")
+    async def number_fact(n: int):
+        await asyncio.sleep(0.02)
+        return PlainTextResponse(f"{n} is a number (fake numbersapi).")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "stats": stats,
+                "config": {"latency": cfg.latency.spec, "error_rate": cfg.error_rate,
+                           "rate_limit_rate": cfg.rate_limit_rate, "tokens_per_s": cfg.tokens_per_s}}
+
+    return app
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    uvicorn.run(create_app(Config(args)), host=args.host, port=args.port, log_level="warning")
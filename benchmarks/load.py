@@ -0,0 +1,234 @@
+"""
+Closed-loop load driver for the backends. For each scenario and
+concurrency level it keeps N requests in flight for --duration seconds
+and records throughput, latency percentiles, status codes, the backend's
+event-loop lag (from its /metrics histogram) and this driver's own loop
+lag (to show when the driver, not the backend, is the bottleneck).
+
+    python load.py --scenarios query eval agent ask --concurrency 1 8 32 \
+        --mock4 http://localhost:8000 --mock5 http://localhost:8001 --label my-change
+
+Results are written to results/<timestamp>-<label>.json; pass
+--baseline <older result> to print the change against it.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from collections import Counter
+
+import httpx
+
+PROMPTS = [
+    "What are the main schedule risks for this project?",
+    "Summarise the next three milestones and their dependencies.",
+    "Which activities are on the critical path and how much float do they have?",
+    "What is the likely impact of a two-week steel delivery delay?",
+    "List the permits still outstanding and when they are needed.",
+]
+
+MODELS = ["gpt-4o-mini", "gpt-4.1-mini"]
+
+
+def _prompt():
+    # a random suffix keeps response and semantic caches from answering everything
+    return f"{random.choice(PROMPTS)} (run {random.randrange(10**9)})"
+
+
+# scenario -> (backend, path, payload factory)
+SCENARIOS = {
+    "query": ("mock4", "/query", lambda a: {"model": MODELS[0], "prompt": _prompt(), "project_id": a.project_id,
+                                            "use_cache": a.cache}),
+    "eval": ("mock4", "/eval", lambda a: {"model_a": MODELS[0], "model_b": MODELS[1], "prompt": _prompt(),
+                                          "project_id": a.project_id, "use_cache": a.cache}),
+    "agent": ("mock4", "/agent", lambda a: {"model": MODELS[0], "task": f"What is 12 * 7? {_prompt()}",
+                                            "project_id": a.project_id, "use_cache": a.cache}),
+    "ask": ("mock5", "/ask", lambda a: {"model_a": MODELS[0], "model_b": MODELS[1], "prompt": _prompt(),
+                                        "project_id": a.project_id, "use_cache": a.cache}),
+}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[i]
+
+
+def parse_histogram(text: str, name: str):
+    """{le: cumulative count} for an unlabelled histogram in Prometheus text format."""
+    buckets = {}
+    for line in text.splitlines():
+        if line.startswith(name + "_bucket{"):
+            labels, value = line[len(name) + 8:].rsplit("} ", 1)
+            le = labels.split('le="', 1)[1].split('"', 1)[0]
+            buckets[float("inf") if le == "+Inf" else float(le)] = float(value)
+    return buckets
+
+
+def histogram_quantile(before, after, q):
+    """Upper bucket bound holding the q-quantile of observations made between two scrapes."""
+    bounds = sorted(after)
+    deltas = [after[b] - before.get(b, 0) for b in bounds]
+    total = deltas[-1] if deltas else 0
+    if total <= 0:
+        return None
+    for bound, cumulative in zip(bounds, deltas):
+        if cumulative >= q * total:
+            return bound
+    return bounds[-1]
+
+
+async def scrape_lag(client, base):
+    try:
+        resp = await client.get(base + "/metrics", timeout=5)
+        return parse_histogram(resp.text, "event_loop_lag_seconds")
+    except httpx.HTTPError:
+        return {}
+
+
+async def driver_lag_monitor(samples, stop, interval=0.05):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def run_level(client, args, scenario, concurrency):
+    backend, path, payload = SCENARIOS[scenario]
+    base = getattr(args, backend)
+    latencies, statuses = [], Counter()
+    stop_at = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            try:
+                body = {k: v for k, v in payload(args).items() if v is not None}
+                resp = await client.post(base + path, json=body, timeout=args.timeout)
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            end = time.perf_counter()
+            if start >= measure_from:
+                latencies.append(end - start)
+                statuses[status] += 1
+
+    lag_before = await scrape_lag(client, base)
+    driver_lag, stop = [], asyncio.Event()
+    monitor = asyncio.create_task(driver_lag_monitor(driver_lag, stop))
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = max(1e-9, time.perf_counter() - measure_from)
+    stop.set()
+    await monitor
+    lag_after = await scrape_lag(client, base)
+
+    latencies.sort()
+    driver_lag.sort()
+    ok = statuses.get("200", 0)
+    ms = lambda v: None if v is None else round(v * 1000, 1)
+    return {
+        "scenario": scenario,
+        "endpoint": path,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "error_rate": round(1 - ok / len(latencies), 4) if latencies else None,
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {"p50": ms(percentile(latencies, 50)), "p95": ms(percentile(latencies, 95)),
+                       "p99": ms(percentile(latencies, 99)), "max": ms(latencies[-1] if latencies else None)},
+        "statuses": dict(statuses),
+        "server_loop_lag_ms": {"p50": ms(histogram_quantile(lag_before, lag_after, 0.5)),
+                               "p99": ms(histogram_quantile(lag_before, lag_after, 0.99))} if lag_after else None,
+        "driver_loop_lag_ms": {"p50": ms(percentile(driver_lag, 50)), "p99": ms(percentile(driver_lag, 99))},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, threshold):
+    """Print per-level changes against a baseline run; returns the list of regressions."""
+    old = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = old.get((r["scenario"], r["concurrency"]))
+        if b is None:
+            continue
+        p95, b_p95 = r["latency_ms"]["p95"], b["latency_ms"]["p95"]
+        line = f"{r['scenario']:>6} c={r['concurrency']:<4} rps {b['rps']} -> {r['rps']}"
+        if p95 is not None and b_p95:
+            line += f", p95 {b_p95} -> {p95} ms"
+        slower = p95 is not None and b_p95 and p95 > b_p95 * (1 + threshold)
+        fewer = b["rps"] and r["rps"] < b["rps"] * (1 - threshold)
+        if slower or fewer:
+            line += "  REGRESSION"
+            regressions.append(r)
+        print(line)
+    return regressions
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency))
+    results = []
+    async with httpx.AsyncClient(limits=limits) as client:
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = await run_level(client, args, scenario, concurrency)
+                print(f"{scenario:>6} c={concurrency:<4} rps={result['rps']:<8} "
+                      f"p50={result['latency_ms']['p50']} p95={result['latency_ms']['p95']} "
+                      f"p99={result['latency_ms']['p99']} ms  errors={result['error_rate']}  "
+                      f"server lag p99={(result['server_loop_lag_ms'] or {}).get('p99')} ms")
+                results.append(result)
+    return {
+        "label": args.label,
+        "timestamp": int(time.time()),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {"duration_s": args.duration, "warmup_s": args.warmup, "cache": args.cache,
+                     "project_id": args.project_id},
+        "results": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--mock4", default="http://localhost:8000", help="mock-task-4 backend")
+    parser.add_argument("--mock5", default="http://localhost:8001", help="mock-task-5 backend")
+    parser.add_argument("--project-id", default=None)
+    parser.add_argument("--cache", action="store_true", help="let the backends' caches answer")
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--out-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results"))
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    report = asyncio.run(main(args))
+    os.makedirs(args.out_dir, exist_ok=True)
+    path = os.path.join(args.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.label}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {path}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,277 @@
+"""
+Microbenchmarks for the pure-Python code that runs on every request and
+grows with data size: milestone retrieval, PDF chunking, completion text
+extraction, response scoring and query logging. Inputs come from seeded
+synthetic generators at several sizes.
+
+    python micro.py                    # run and compare against micro_baseline.json
+    python micro.py --update-baseline  # record a new baseline on this machine
+    python micro.py --filter retrieve --quick
+
+Each case reports the median and fastest time per call over several timed
+rounds and the peak traced allocation of one call (tracemalloc). The run
+fails (exit status 1) if any case's fastest round is slower than its
+baseline by more than --threshold. Baselines are machine-specific: re-record them when the
+benchmark host changes.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import importlib
+import statistics
+import tracemalloc
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE_PATH = os.path.join(HERE, "micro_baseline.json")
+
+# module names shared between the backends and test/; cleared between imports
+_SHARED = ("rag_utils", "gateway", "cache", "semantic_cache", "log_writer", "log_reader", "metrics", "main",
+           "agents", "utils", "rag_agent", "embeddings", "pdf_extract", "chunking", "ann_index")
+
+
+def import_from(directory: str, *names):
+    """Import modules from one app directory without clashing with same-named modules from another."""
+    for name in _SHARED:
+        sys.modules.pop(name, None)
+    sys.path.insert(0, directory)
+    try:
+        return [importlib.import_module(n) for n in names]
+    finally:
+        sys.path.remove(directory)
+        for name in _SHARED:
+            sys.modules.pop(name, None)
+
+
+# --- synthetic data ---
+
+WORDS = ("schedule", "milestone", "risk", "delay", "crane", "pour", "slab", "permit", "weather", "critical",
+         "path", "float", "handover", "steel", "frame", "inspection", "week", "supplier", "design", "approval",
+         "excavation", "piling", "facade", "roof", "commissioning", "snagging", "drainage", "scaffold")
+
+
+def make_project(n_milestones: int, seed: int = 0) -> dict:
+    rnd = random.Random(seed)
+    milestones = []
+    for i in range(n_milestones):
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))).capitalize()
+        notes = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(8, 30)))
+        milestones.append({"date": f"2025-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                           "title": f"A-{1000 + i} {title}", "notes": notes + "."})
+    return {"id": "bench", "name": "Synthetic project", "milestones": milestones}
+
+
+def make_document(n_words: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n_words):
+        out.append(rnd.choice(WORDS))
+        if i % 17 == 16:
+            out[-1] += "."
+    return " ".join(out)
+
+
+def make_completion(n_words: int, seed: int = 0) -> dict:
+    return {"id": "chatcmpl-bench", "object": "chat.completion", "model": "bench",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": make_document(n_words, seed)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": n_words, "total_tokens": 100 + n_words}}
+
+
+# --- measurement ---
+
+def measure(fn, min_time: float = 0.2, rounds: int = 5) -> dict:
+    fn()  # warm caches and lazy initialisation
+    number, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / rounds or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / rounds / 10 else 2
+    per_call = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()  # as timeit does: keep collector pauses out of the timings
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            per_call.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # smallest of a few traced calls: background threads (log writers) allocate while we trace
+    peaks = []
+    tracemalloc.start()
+    try:
+        for _ in range(3):
+            base, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+    return {"us_per_call": round(statistics.median(per_call) * 1e6, 3),
+            "min_us": round(min(per_call) * 1e6, 3),
+            "peak_alloc_kib": round(max(0, min(peaks)) / 1024, 1),
+            "calls_per_round": number}
+
+
+# --- cases ---
+
+def build_cases(sizes) -> dict:
+    """name -> zero-argument callable, for every hot path at every size."""
+    cases = {}
+    os.environ.setdefault("SEMANTIC_CACHE", "off")
+    m4_rag, m4_main = import_from(os.path.join(ROOT, "mock-task-4", "backend"), "rag_utils", "main")
+    m5_rag, m5_agents, m5_utils = import_from(os.path.join(ROOT, "mock-task-5", "backend"),
+                                              "rag_utils", "agents", "utils")
+    rag_agent, chunking = import_from(os.path.join(ROOT, "test"), "rag_agent", "chunking")
+
+    for n in sizes.milestones:
+        for label, rag in (("m4", m4_rag), ("m5", m5_rag)):
+            project = make_project(n)
+            projects = {"bench": project}
+            rag.build_project_index(project)
+            cases[f"{label}.build_project_index[milestones={n}]"] = (
+                lambda rag=rag, n=n: rag.build_project_index(make_project_cached(n)))
+            cases[f"{label}.retrieve_relevant_docs[milestones={n}]"] = (
+                lambda rag=rag, projects=projects: rag.retrieve_relevant_docs(
+                    projects, "bench", "steel delivery delay A-1010 weather", top_k=3))
+
+    for n in sizes.doc_words:
+        doc = make_document(n)
+        cases[f"test.chunk_text[words={n}]"] = lambda doc=doc: rag_agent.chunk_text(doc)
+        pages = [(i + 1, doc[i * 4000:(i + 1) * 4000]) for i in range(len(doc) // 4000 + 1)]
+        cases[f"test.iter_span_chunks[words={n}]"] = (
+            lambda pages=pages: list(chunking.iter_span_chunks(pages, chunking.TextBuffer())))
+
+    for n in sizes.response_words:
+        resp = make_completion(n)
+        text = resp["choices"][0]["message"]["content"]
+        model_response = SimpleNamespace(model_dump=lambda resp=resp: resp)
+        cases[f"m4.extract_content_from_completion[words={n}]"] = (
+            lambda resp=resp: m4_main.extract_content_from_completion(resp))
+        cases[f"m4.extract_content_from_completion.model_dump[words={n}]"] = (
+            lambda r=model_response: m4_main.extract_content_from_completion(r))
+        cases[f"m5.extract_text[words={n}]"] = lambda resp=resp: m5_agents.extract_text(resp)
+        cases[f"m5.score_response[words={n}]"] = lambda text=text: m5_agents.score_response(text)
+        responses = {f"model-{i}": {"text": make_document(n, seed=i), "latency_ms": 100, "error": None,
+                                    "cache": "miss"} for i in range(4)}
+        cases[f"m5.score_responses[models=4,words={n}]"] = (
+            lambda responses=responses: m5_agents.score_responses(responses))
+
+    for n in sizes.prompt_words:
+        prompt = make_document(n)
+        cases[f"m4.log_query[prompt_words={n}]"] = lambda prompt=prompt: m4_main.log_query(
+            model="bench", endpoint="/query", prompt=prompt, response_len=100, latency_ms=10)
+        cases[f"m5.log_event[prompt_words={n}]"] = lambda prompt=prompt: m5_utils.log_event(
+            "/ask", "forecaster", "bench", prompt, "response", 10)
+    # the backends configure INFO logging on import; time the row write, not the console echo
+    logging.getLogger("backend_utils").setLevel(logging.WARNING)
+    return cases
+
+
+_PROJECTS = {}
+
+
+def make_project_cached(n):
+    """Fresh copy of the same project for index-build timing (the build mutates it)."""
+    if n not in _PROJECTS:
+        _PROJECTS[n] = make_project(n)
+    return {**_PROJECTS[n]}
+
+
+SIZES = SimpleNamespace(milestones=[100, 1_000, 10_000], doc_words=[5_000, 50_000, 200_000],
+                        response_words=[50, 500, 5_000], prompt_words=[20, 2_000])
+QUICK_SIZES = SimpleNamespace(milestones=[100, 1_000], doc_words=[5_000], response_words=[50, 500],
+                              prompt_words=[20])
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get("cases", {}).get(name)
+        if b is None:
+            continue
+        # the fastest round is the least disturbed by other load on the host
+        ratio = r["min_us"] / b["min_us"] if b["min_us"] else 1.0
+        r["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, b["min_us"], r["min_us"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--retries", type=int, default=2, help="re-measurements of a case before it counts as slower")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--out", help="also write results JSON here")
+    args = parser.parse_args(argv)
+    args.baseline = os.path.abspath(args.baseline)
+    args.out = args.out and os.path.abspath(args.out)
+    # the backends write logs/ relative to the working directory; keep them out of the tree
+    os.chdir(tempfile.mkdtemp(prefix="micro-"))
+
+    cases = build_cases(QUICK_SIZES if args.quick else SIZES)
+    results = {}
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(fn)
+        r = results[name]
+        print(f"{name:<62} {r['us_per_call']:>12.2f} us  {r['peak_alloc_kib']:>10.1f} KiB")
+
+    report = {"timestamp": int(time.time()), "python": sys.version.split()[0], "cases": results}
+    if args.update_baseline:
+        baseline = {"cases": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(timestamp=report["timestamp"], python=report["python"])
+        baseline["cases"].update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline updated: {args.baseline}")
+        regressions = []
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        # re-measure suspects so a noisy moment on the host does not fail the run
+        for _ in range(args.retries):
+            if not regressions:
+                break
+            for name, *_ in regressions:
+                again = measure(cases[name])
+                if again["min_us"] < results[name]["min_us"]:
+                    results[name] = again
+            regressions = compare(results, baseline, args.threshold)
+        for name, old, new, ratio in regressions:
+            print(f"REGRESSION {name}: {old:.2f} -> {new:.2f} us ({ratio:.2f}x)")
+    else:
+        print("no baseline yet; run with --update-baseline to record one")
+        regressions = []
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
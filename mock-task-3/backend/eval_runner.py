@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+import litellm
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+API_BASE = os.getenv("LITELLM_API_BASE", "http://localhost:4000")
+RUNS_DIR = os.getenv("EVAL_RUNS_DIR", os.path.join("cache", "evals"))
+# Datasets are only read from here, so a request cannot open arbitrary server files
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets")
+
+_RUN_ID = re.compile(r"^[\w.-]+$")
+
+
+def case_id(case: dict) -> str:
+    return case.get("id") or hashlib.sha256(case["input"].encode("utf-8")).hexdigest()[:16]
+
+
+def dataset_path(name: str) -> str:
+    """Path of dataset `name` (relative to DATASETS_DIR); ValueError if it would leave that directory."""
+    root = os.path.realpath(DATASETS_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"dataset must be a file under {DATASETS_DIR}")
+    return path
+
+
+def check_run_id(run_id: str) -> str:
+    """`run_id` if it is safe to use as a directory name (letters, digits, _ . -); ValueError otherwise."""
+    if not _RUN_ID.match(run_id) or not run_id.strip("."):
+        raise ValueError(f"invalid run_id {run_id!r}: use letters, digits, '_', '.' and '-'")
+    return run_id
+
+
+def load_dataset(name: str) -> list:
+    """Read eval cases ({"input", "expected", optional "id"}) from a JSONL file in DATASETS_DIR."""
+    path = dataset_path(name)
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            case = json.loads(line)
+            if "input" not in case:
+                raise ValueError(f"{name}:{n}: case has no 'input'")
+            case.setdefault("expected", "")
+            case["id"] = case_id(case)
+            cases.append(case)
+    return cases
+
+
+class GenerationCache:
+    """
+    (model, input) -> output in SQLite, so re-judging or resuming never
+    regenerates. Calls are blocking; the runner makes them from worker
+    threads, so one lock serialises use of the connection.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "model TEXT NOT NULL, input_hash TEXT NOT NULL, output TEXT NOT NULL, latency_ms INTEGER, "
+            "PRIMARY KEY (model, input_hash))")
+        self._conn.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str):
+        with self._lock:
+            return self._conn.execute("SELECT output, latency_ms FROM generations WHERE model = ? AND input_hash = ?",
+                                      (model, self._hash(text))).fetchone()
+
+    def put(self, model: str, text: str, output: str, latency_ms: int):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?)",
+                               (model, self._hash(text), output, latency_ms))
+            self._conn.commit()
+
+
+class EvalRunner:
+    """
+    Runs every (case, model) cell concurrently, at most `concurrency`
+    model calls at a time. Generations are cached across runs; each
+    finished cell is appended to `<runs_dir>/<run_id>/results.jsonl`, so
+    running again with the same run_id only does the cells that are
+    missing or failed. `evaluator` is the CriteriaEvalChain used to judge.
+    """
+
+    def __init__(self, cases, models, evaluator, run_id: str = None, concurrency: int = None,
+                 runs_dir: str = RUNS_DIR, regenerate: bool = False):
+        self.cases = cases
+        self.models = list(dict.fromkeys(models))
+        self.evaluator = evaluator
+        self.run_id = check_run_id(run_id) if run_id else time.strftime("%Y%m%d-%H%M%S")
+        self.concurrency = concurrency or int(os.getenv("EVAL_CONCURRENCY", "16"))
+        self.regenerate = regenerate
+        self.run_dir = os.path.join(runs_dir, self.run_id)
+        self.checkpoint_path = os.path.join(self.run_dir, "results.jsonl")
+        self.cache = GenerationCache(os.path.join(runs_dir, "generations.sqlite"))
+        self.stats = {"cells": 0, "resumed": 0, "generated": 0, "cached": 0, "errors": 0}
+
+    def _load_checkpoint(self) -> dict:
+        done = {}
+        if not os.path.exists(self.checkpoint_path):
+            return done
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line from an interrupted run
+                if "error" not in row:
+                    done[(row["case_id"], row["model"])] = row
+        return done
+
+    async def _generate(self, model: str, text: str, sem: asyncio.Semaphore):
+        # SQLite calls run off the event loop so they do not stall the other cells
+        cached = None if self.regenerate else await asyncio.to_thread(self.cache.get, model, text)
+        if cached is not None:
+            self.stats["cached"] += 1
+            return cached[0], cached[1]
+        async with sem:
+            start = time.time()
+            response = await litellm.acompletion(
+                model=model,
+                messages=[{"role": "user", "content": text}],
+                api_base=API_BASE,
+                api_key=os.getenv("LITELLM_API_KEY"),
+            )
+        latency_ms = int((time.time() - start) * 1000)
+        output = response["choices"][0]["message"]["content"]
+        await asyncio.to_thread(self.cache.put, model, text, output, latency_ms)
+        self.stats["generated"] += 1
+        return output, latency_ms
+
+    async def _run_cell(self, case: dict, model: str, sem: asyncio.Semaphore, out):
+        row = {"case_id": case["id"], "model": model, "input": case["input"], "expected": case["expected"]}
+        try:
+            output, latency_ms = await self._generate(model, case["input"], sem)
+            async with sem:
+                score = await self.evaluator.aevaluate_strings(
+                    output=output,
+                    input=case["input"],
+                    prediction=output
+                )
+            row.update(output=output, score=score, latency_ms=latency_ms)
+        except Exception as e:
+            logger.error(f"Eval failed for model={model}, input={case['input']}, error={e}")
+            row["error"] = str(e)
+            self.stats["errors"] += 1
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        out.flush()
+        return row
+
+    async def run(self) -> list:
+        """Results for every (case, model) cell, in case then model order."""
+        os.makedirs(self.run_dir, exist_ok=True)
+        done = self._load_checkpoint()
+        sem = asyncio.Semaphore(self.concurrency)
+        cells = [(case, model) for case in self.cases for model in self.models]
+        self.stats["cells"] = len(cells)
+        self.stats["resumed"] = sum(1 for case, model in cells if (case["id"], model) in done)
+        with open(self.checkpoint_path, "a", encoding="utf-8") as out:
+            pending = {(case["id"], model): self._run_cell(case, model, sem, out)
+                       for case, model in cells if (case["id"], model) not in done}
+            finished = await asyncio.gather(*pending.values())
+        results = dict(done)
+        results.update(zip(pending.keys(), finished))
+        return [results[(case["id"], model)] for case, model in cells]
@@ -1,9 +1,10 @@
 from utils import LiteLLM
+from eval_runner import EvalRunner, load_dataset, case_id
 from dotenv import load_dotenv
-import litellm
 from langchain.evaluation.criteria import Criteria, CriteriaEvalChain
 from langchain.prompts import ChatPromptTemplate
-import os
+import json
+import asyncio
 import logging
 logger = logging.getLogger(__name__)
 
@@ -21,49 +22,43 @@ prompt = ChatPromptTemplate.from_template(
     "You are an evaluator. Evaluate the model output below for {criteria}.\n"
     "Input: {input}\n"
     "Output: {output}\n"
-    "Respond with a score (0-1) or a short comment."
+    "Explain briefly, then give your verdict (Y or N) alone on the last line."
 )
 
 
-def run_evals(models=["gpt-4.1-mini"]):
-    eval_llm = LiteLLM()
-    results = []
-    evaluator = CriteriaEvalChain.from_llm(
-        llm=eval_llm,
+def build_evaluator():
+    return CriteriaEvalChain.from_llm(
+        llm=LiteLLM(),
         criteria_name="correctness",
         prompt=prompt
     )
 
-    for case in TEST_CASES:
-        for model in models:
-            try:
-                response = litellm.completion(
-                    model=model,
-                    messages=[{"role": "user", "content": case["input"]}],
-                    api_base="http://localhost:4000",
-                    api_key=os.getenv("LITELLM_API_KEY"),
-                )
-                output = response["choices"][0]["message"]["content"]
 
-                score = evaluator.evaluate_strings(
-                    output=output,
-                    input=case["input"],
-                    prediction=output
-                )
-                results.append({
-                    "model": model,
-                    "input": case["input"],
-                    "output": output,
-                    "expected": case["expected"],
-                    "score": score
-                })
-            except Exception as e:
-                logger.error(
-                    f"Eval failed for model={model}, input={case['input']}, error={e}")
-                results.append({
-                    "model": model,
-                    "input": case["input"],
-                    "error": str(e)
-                })
+async def arun_evals(models=["gpt-4.1-mini"], dataset=None, run_id=None, concurrency=None):
+    """
+    Evaluate every case in `dataset` (a JSONL file in backend/datasets/;
+    TEST_CASES by default)
+    against every model. Pass a previous run_id to resume it.
+    """
+    cases = load_dataset(dataset) if dataset else [dict(c, id=case_id(c)) for c in TEST_CASES]
+    runner = EvalRunner(cases, models, build_evaluator(), run_id=run_id, concurrency=concurrency)
+    results = await runner.run()
+    logger.info(f"Eval run {runner.run_id}: {runner.stats}")
+    return {"run_id": runner.run_id, "stats": runner.stats, "results": results}
 
-    return results
+
+def run_evals(models=["gpt-4.1-mini"], dataset=None, run_id=None, concurrency=None):
+    return asyncio.run(arun_evals(models, dataset, run_id, concurrency))["results"]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run (or resume) an evaluation.")
+    parser.add_argument("--dataset", help="JSONL file of {input, expected} cases in backend/datasets/")
+    parser.add_argument("--models", nargs="+", default=["gpt-4.1-mini"])
+    parser.add_argument("--run-id", help="resume this run")
+    parser.add_argument("--concurrency", type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    out = asyncio.run(arun_evals(args.models, args.dataset, args.run_id, args.concurrency))
+    print(json.dumps({"run_id": out["run_id"], "stats": out["stats"]}))
@@ -1,11 +1,12 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from typing import List, Optional
 from pydantic import BaseModel
 import litellm
 import logging
 from agent import run_agent
 from dotenv import load_dotenv
 import os
-from evals import run_evals
+from evals import arun_evals
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -52,11 +53,13 @@ async def run_agent_endpoint(request: AgentRequest):
 
 
 @app.get("/evals")
-async def run_eval_endpoint():
+async def run_eval_endpoint(models: List[str] = Query(["gpt-4.1-mini"]), dataset: Optional[str] = None,
+                            run_id: Optional[str] = None, concurrency: Optional[int] = None):
     try:
-        results = run_evals()
-        print(results)
-        return {"results": results}
+        return await arun_evals(models, dataset, run_id, concurrency)
+    except ValueError as e:
+        # bad run_id, dataset outside backend/datasets/ or malformed dataset
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Error while running evals")
         raise HTTPException(status_code=500, detail=str(e))
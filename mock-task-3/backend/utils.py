@@ -1,5 +1,6 @@
 
 import os
+import asyncio
 from dotenv import load_dotenv
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.outputs.llm_result import LLMResult
@@ -9,24 +10,34 @@ import litellm
 
 
 load_dotenv()
+
+API_BASE = os.getenv("LITELLM_API_BASE", "http://localhost:4000")
+
+
 class LiteLLM(BaseLLM):
     model_name: str = "gpt-4.1-mini"
 
+    def _completion_kwargs(self, prompt: str) -> dict:
+        return {"model": self.model_name, "messages": [{"role": "user", "content": prompt}],
+                "api_base": API_BASE, "api_key": os.getenv("LITELLM_API_KEY")}
+
     def _generate(
-        self, prompts: List[str], stop: Optional[List[str]] = None
+        self, prompts: List[str], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
     ) -> LLMResult:
         generations = []
         for prompt in prompts:
-            response = litellm.completion(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                api_base="http://localhost:4000",
-                api_key=os.getenv("LITELLM_API_KEY"),
-            )
+            response = litellm.completion(**self._completion_kwargs(prompt))
             text = response["choices"][0]["message"]["content"]
             generations.append([Generation(text=text)])
         return LLMResult(generations=generations)
 
+    async def _agenerate(
+        self, prompts: List[str], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any
+    ) -> LLMResult:
+        """Native async path (the default would run _generate in a thread per call)."""
+        responses = await asyncio.gather(*(litellm.acompletion(**self._completion_kwargs(p)) for p in prompts))
+        return LLMResult(generations=[[Generation(text=r["choices"][0]["message"]["content"])] for r in responses])
+
     @property
     def _llm_type(self) -> str:
         return "litellm"
@@ -37,8 +37,20 @@ with tab2:
 # --- Evals Tab ---
 with tab3:
     st.header("LLM Evaluations")
+    eval_models = st.multiselect("Models", ["gpt-4.1-mini", "anthropic/claude-3-haiku"], default=["gpt-4.1-mini"])
+    dataset = st.text_input("Dataset (JSONL file in backend/datasets/, e.g. sample.jsonl; blank for the built-in cases)")
+    run_id = st.text_input("Resume run id (optional)")
     if st.button("Run Evals"):
-        response = requests.get("http://localhost:8000/evals")
-        results = response.json()["results"]
-        for r in results:
-            st.write(r)
+        params = {"models": eval_models}
+        if dataset:
+            params["dataset"] = dataset
+        if run_id:
+            params["run_id"] = run_id
+        response = requests.get("http://localhost:8000/evals", params=params)
+        body = response.json()
+        if response.status_code != 200:
+            st.error(body.get("detail", response.text))
+        else:
+            st.caption(f"Run {body['run_id']}: {body['stats']}")
+            for r in body["results"]:
+                st.write(r)
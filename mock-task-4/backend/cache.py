@@ -0,0 +1,148 @@
+# backend/cache.py
+import os
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+_WS_RE = re.compile(r"\s+")
+
+
+def cache_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any] = None) -> str:
+    """Stable key over (model, normalized messages, generation params)."""
+    norm = [{"role": str(m.get("role", "")).lower(),
+             "content": _WS_RE.sub(" ", str(m.get("content", ""))).strip()}
+            for m in messages]
+    payload = json.dumps({"model": model, "messages": norm, "params": params or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache for model responses:
+    - in-process LRU with TTL, bounded by entry count and total bytes
+    - optional SQLite file that survives restarts
+    Values must be JSON-serialisable. Async callers use aget/aset, which
+    check the memory tier inline and run the SQLite tier in a worker
+    thread so disk I/O never blocks the event loop.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_s: float = 3600, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._lru: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024")),
+            max_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB", "32")) * 1024 * 1024),
+            ttl_s=float(os.getenv("RESPONSE_CACHE_TTL_S", "3600")),
+            db_path=os.getenv("RESPONSE_CACHE_DB") or None,
+        )
+
+    def _put_memory(self, key: str, value: Any, size: int, created: float):
+        if size > self.max_bytes:
+            return
+        old = self._lru.pop(key, None)
+        if old:
+            self._bytes -= old[1]
+        self._lru[key] = (created, size, value)
+        self._bytes += size
+        while self._lru and (len(self._lru) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted, _) = self._lru.popitem(last=False)
+            self._bytes -= evicted
+
+    def _get_memory(self, key: str, now: float) -> Optional[Any]:
+        with self._lock:
+            entry = self._lru.get(key)
+            if not entry:
+                return None
+            created, size, value = entry
+            if now - created <= self.ttl_s:
+                self._lru.move_to_end(key)
+                return value
+            del self._lru[key]
+            self._bytes -= size
+            return None
+
+    def _get_disk(self, key: str, now: float) -> Tuple[Optional[Any], str]:
+        with self._db_lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None, "miss"
+            raw, created = row
+            if now - created > self.ttl_s:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None, "miss"
+        value = json.loads(raw)
+        # promote to the memory tier
+        with self._lock:
+            self._put_memory(key, value, len(raw), created)
+        return value, "disk"
+
+    def _set_disk(self, key: str, raw: str, created: float):
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                             (key, raw, created))
+            self._db.commit()
+
+    def get(self, key: str) -> Tuple[Optional[Any], str]:
+        """Return (value, tier) where tier is "memory", "disk" or "miss"."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value, "memory"
+        if self._db is None:
+            return None, "miss"
+        return self._get_disk(key, now)
+
+    async def aget(self, key: str) -> Tuple[Optional[Any], str]:
+        """get() for async code: the disk tier is read in a worker thread."""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value, "memory"
+        if self._db is None:
+            return None, "miss"
+        return await asyncio.to_thread(self._get_disk, key, now)
+
+    def set(self, key: str, value: Any):
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, len(raw), now)
+        if self._db is not None:
+            self._set_disk(key, raw, now)
+
+    async def aset(self, key: str, value: Any):
+        """set() for async code: the disk tier is written in a worker thread."""
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._put_memory(key, value, len(raw), now)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_disk, key, raw, now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._lru), "bytes": self._bytes, "disk": self._db is not None}
@@ -0,0 +1,248 @@
+# backend/log_reader.py
+import io
+import os
+import re
+import csv
+import json
+import glob
+import base64
+import bisect
+import threading
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+INT_FIELDS = ("timestamp", "ts", "response_len", "latency_ms", "ttft_ms")
+
+# rotated file names from log_writer: <name>-YYYYmmdd-HHMMSS.csv, then -1, -2... for same-second rotations
+_ROTATED_RE = re.compile(r"-(\d{8}-\d{6})(?:-(\d+))?\.csv$")
+
+
+def _iter_records(f, offset: int) -> Iterator[Tuple[int, int, List[str]]]:
+    """
+    Yield (start, end, fields) for each complete CSV record from byte
+    `offset`. Works on the raw bytes so offsets stay exact, and keeps
+    reading lines while a quoted field spans a newline. A trailing record
+    without its newline (the writer is mid-flush) is left for next time.
+    """
+    f.seek(offset)
+    start = offset
+    buf = b""
+    while True:
+        line = f.readline()
+        if not line:
+            return
+        buf += line
+        if buf.count(b'"') % 2 == 0 and buf.endswith(b"\n"):
+            end = start + len(buf)
+            fields = next(csv.reader(io.StringIO(buf.decode("utf-8"))), [])
+            yield start, end, fields
+            start, buf = end, b""
+
+
+class _FileIndex:
+    """Sparse (timestamp, offset) index over one log file, extended as the file grows."""
+
+    STRIDE = 256
+
+    def __init__(self, path: str, ts_field: str):
+        self.path = path
+        self.ts_field = ts_field
+        self.inode = os.stat(path).st_ino
+        self.header: List[str] = []
+        self.data_start = 0
+        self.indexed_upto = 0
+        self.rows = 0
+        self.ts: List[int] = []
+        self.offsets: List[int] = []
+        self.min_ts: Optional[int] = None
+        self.max_ts: Optional[int] = None
+
+    def refresh(self):
+        size = os.path.getsize(self.path)
+        if size <= self.indexed_upto:
+            return
+        with open(self.path, "rb") as f:
+            records = _iter_records(f, self.indexed_upto)
+            if not self.header:
+                first = next(records, None)
+                if first is None:
+                    return
+                self.header = first[2]
+                self.data_start = self.indexed_upto = first[1]
+            ts_col = self.header.index(self.ts_field) if self.ts_field in self.header else None
+            for start, end, fields in records:
+                ts = _to_int(fields[ts_col]) if ts_col is not None and ts_col < len(fields) else None
+                if ts is not None:
+                    if self.rows % self.STRIDE == 0:
+                        self.ts.append(ts)
+                        self.offsets.append(start)
+                    self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+                    self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+                self.rows += 1
+                self.indexed_upto = end
+
+    def seek_offset(self, since: Optional[int]) -> int:
+        """Byte offset at or before the first row with ts >= since (rows are appended in time order)."""
+        if since is None or not self.ts:
+            return self.data_start
+        i = bisect.bisect_left(self.ts, since) - 1
+        return self.offsets[i] if i >= 0 else self.data_start
+
+
+def _to_int(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_cursor(inode: int, offset: int) -> str:
+    return base64.urlsafe_b64encode(f"{inode}:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    inode, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+    return int(inode), int(offset)
+
+
+class LogStore:
+    """
+    Read side of the query logs: the active CSV plus every rotated
+    `<name>-*.csv`, oldest first. Supports time/model/endpoint/error
+    filters with opaque cursors (file inode + byte offset, so a cursor
+    survives rotation) and lazy row iteration for streaming exports.
+    """
+
+    def __init__(self, directory: str, name: str, ts_field: str = "timestamp", max_scan: int = 50_000):
+        self.directory = directory
+        self.name = name
+        self.ts_field = ts_field
+        self.max_scan = max_scan
+        self._indexes: Dict[int, _FileIndex] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _rotation_order(path: str) -> Tuple[str, int, str]:
+        # plain name order would put "...-HHMMSS-1.csv" before the older "...-HHMMSS.csv"
+        m = _ROTATED_RE.search(path)
+        return (m.group(1), int(m.group(2) or 0), path) if m else ("", 0, path)
+
+    def files(self) -> List[_FileIndex]:
+        rotated = sorted(glob.glob(os.path.join(self.directory, f"{self.name}-*.csv")), key=self._rotation_order)
+        active = os.path.join(self.directory, f"{self.name}.csv")
+        paths = rotated + ([active] if os.path.exists(active) else [])
+        out = []
+        with self._lock:
+            for path in paths:
+                try:
+                    inode = os.stat(path).st_ino
+                except FileNotFoundError:
+                    continue
+                idx = self._indexes.get(inode)
+                if idx is None:
+                    idx = self._indexes[inode] = _FileIndex(path, self.ts_field)
+                idx.path = path  # follows renames on rotation
+                idx.refresh()
+                out.append(idx)
+            live = {i.inode for i in out}
+            for inode in [k for k in self._indexes if k not in live]:
+                del self._indexes[inode]
+        return out
+
+    def _matches(self, row: Dict[str, Any], since, until, model, endpoint, error) -> bool:
+        ts = row.get(self.ts_field)
+        if since is not None and (ts is None or ts < since):
+            return False
+        if until is not None and (ts is None or ts > until):
+            return False
+        if model is not None and row.get("model") != model:
+            return False
+        if endpoint is not None and row.get("endpoint") != endpoint:
+            return False
+        if error is not None and bool(row.get("error")) != error:
+            return False
+        return True
+
+    def iter_rows(self, since: int = None, until: int = None, model: str = None, endpoint: str = None,
+                  error: bool = None, cursor: str = None) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        """
+        Yield (cursor, row) for matching rows, oldest first. `cursor`
+        resumes right after the row it was returned with. Rows whose
+        scan did not match yield (cursor, None) every `max_scan` rows
+        so callers can stop with a resumable position.
+        """
+        return self._scan(self.files(), since, until, model, endpoint, error, cursor)
+
+    def _scan(self, files: List[_FileIndex], since, until, model, endpoint, error,
+              cursor) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+        start_inode, start_offset = decode_cursor(cursor) if cursor else (None, None)
+        if start_inode is not None:
+            pos = next((i for i, f in enumerate(files) if f.inode == start_inode), None)
+            # the cursor's file is gone: continue with whatever is left
+            files = files[pos:] if pos is not None else files
+        scanned = 0
+        for n, idx in enumerate(files):
+            if since is not None and idx.max_ts is not None and idx.max_ts < since:
+                continue
+            if until is not None and idx.min_ts is not None and idx.min_ts > until:
+                return
+            offset = start_offset if (n == 0 and start_inode == idx.inode) else idx.seek_offset(since)
+            with open(idx.path, "rb") as f:
+                for _, end, fields in _iter_records(f, max(offset, idx.data_start)):
+                    row = dict(zip(idx.header, fields))
+                    for k in INT_FIELDS:
+                        if k in row:
+                            row[k] = _to_int(row[k])
+                    ts = row.get(self.ts_field)
+                    if until is not None and ts is not None and ts > until:
+                        return
+                    scanned += 1
+                    here = encode_cursor(idx.inode, end)
+                    if self._matches(row, since, until, model, endpoint, error):
+                        yield here, row
+                    elif scanned % self.max_scan == 0:
+                        yield here, None
+
+    def page(self, limit: int = 100, since: int = None, until: int = None, model: str = None,
+             endpoint: str = None, error: bool = None, cursor: str = None) -> Dict[str, Any]:
+        """
+        One page of rows plus the cursor for the next page (None once the
+        log is exhausted). Raises FileNotFoundError when there are no log
+        files at all.
+        """
+        files = self.files()
+        if not files:
+            raise FileNotFoundError(os.path.join(self.directory, f"{self.name}.csv"))
+        rows, next_cursor, scanned_out = [], None, False
+        gen = self._scan(files, since, until, model, endpoint, error, cursor)
+        for here, row in gen:
+            next_cursor = here
+            if row is None:
+                # scanned max_scan rows without filling the page; let the client continue
+                scanned_out = True
+                break
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        else:
+            next_cursor = None
+        gen.close()
+        return {"rows": rows, "next_cursor": next_cursor, "partial_scan": scanned_out}
+
+    def export(self, fmt: str = "ndjson", fields: List[str] = None, **filters) -> Iterator[str]:
+        """Stream matching rows as NDJSON lines or CSV text without holding them in memory."""
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            yield buf.getvalue()
+            for _, row in self.iter_rows(**filters):
+                if row is None:
+                    continue
+                buf.seek(0)
+                buf.truncate()
+                writer.writerow(row)
+                yield buf.getvalue()
+        else:
+            for _, row in self.iter_rows(**filters):
+                if row is not None:
+                    yield json.dumps(row, ensure_ascii=False) + "\n"
@@ -1,22 +1,35 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import logging
 import time
-import csv
 import os
 from typing import List, Dict, Any
-import litellm
-from rag_utils import load_projects, retrieve_relevant_docs, PROMPT_TEMPLATES
-import asyncio
+from rag_utils import load_projects, reload_projects, retrieve_relevant_docs, project_fingerprint, PROMPT_TEMPLATES
+from semantic_cache import SemanticCache
+from context_packer import pack_context, PackedContext
+from log_writer import LogWriter
+from log_reader import LogStore
+from metrics import (current_endpoint, render as render_metrics, monitor_event_loop, HTTP_REQUESTS,
+                     HTTP_LATENCY, LLM_CACHE, CONTEXT_TOKENS)
+from gateway import (call_model, compare_models, stream_model, sse_event, close_client, get_client, upstreams,
+                     router, COMPARE_DEADLINE_S)
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Basic config
+LOG_DIR = "logs"
 LOG_FILE = "query_logs.csv"
-os.makedirs("logs", exist_ok=True)
-LOG_FILEPATH = os.path.join("logs", LOG_FILE)
+LOG_FILEPATH = os.path.join(LOG_DIR, LOG_FILE)
+# number-fact tool upstream; the benchmarks point this at their stand-in server
+NUMBERS_API_BASE = os.getenv("NUMBERS_API_BASE", "http://numbersapi.com")
+# Milestones retrieved per question; the packer keeps what fits CONTEXT_TOKEN_BUDGET
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "3"))
+LOG_FIELDS = ["timestamp", "model", "endpoint", "prompt", "response_len", "latency_ms", "error", "cache",
+              "ttft_ms", "tokens_per_s"]
 
 # Initialize app
 app = FastAPI(title="nPlan Practice LLM API")
@@ -27,14 +40,16 @@ logger = logging.getLogger("backend")
 
 # Load sample project data
 # expects relative path when running from backend/
-PROJECTS = load_projects("../data/projects.json")
+PROJECTS_PATH = "../data/projects.json"
+PROJECTS = load_projects(PROJECTS_PATH)
+
+# Answers near-duplicate /query prompts without a model call
+semantic_cache = SemanticCache.from_env()
 
-# Ensure a CSV log header exists
-if not os.path.exists(LOG_FILEPATH):
-    with open(LOG_FILEPATH, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "model", "endpoint",
-                        "prompt", "response_len", "latency_ms", "error"])
+# Query log rows are written in batches by a background thread (see log_writer.py)
+log_writer = LogWriter.from_env(LOG_DIR, "query_logs", LOG_FIELDS).start()
+# ...and read back page by page across rotated files (see log_reader.py)
+log_store = LogStore(LOG_DIR, "query_logs", ts_field="timestamp")
 
 # Pydantic models
 
@@ -43,49 +58,89 @@ class QueryRequest(BaseModel):
     model: str
     prompt: str
     project_id: str = None  # optional: which project to ground on
+    use_cache: bool = True  # set False to bypass the response cache
 
 
 class EvalRequest(BaseModel):
-    model_a: str
-    model_b: str
+    model_a: str = None
+    model_b: str = None
+    models: List[str] = []  # any further models to compare
     prompt: str
     project_id: str = None
+    deadline_s: float = None  # per-model budget; slower models return an error entry
+    use_cache: bool = True
 
 
 class AgentRequest(BaseModel):
     model: str
     task: str
     project_id: str = None
+    use_cache: bool = True
 
-# Helper: call liteLLM with retries and basic observability
 
+@app.on_event("startup")
+async def startup():
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop())
 
-def call_model(model_name: str, messages: List[Dict[str, str]], max_retries: int = 2) -> Dict[str, Any]:
-    attempt = 0
-    while True:
-        attempt += 1
-        start = time.time()
-        try:
-            # Example using litellm.completion (API may differ by version)
-            # This code assumes litellm.completion returns a dict similar to OpenAI responses.
-            resp = litellm.completion(model=model_name, messages=messages, timeout=60,  api_base="http://localhost:4000",
-                                      api_key=os.getenv("LITELLM_API_KEY"),)
-            latency_ms = int((time.time() - start) * 1000)
-            return {"resp": resp, "latency_ms": latency_ms, "error": None}
-        except Exception as e:
-            latency_ms = int((time.time() - start) * 1000)
-            logger.exception(f"Model call error (model={model_name}): {e}")
-            if attempt > max_retries:
-                return {"resp": None, "latency_ms": latency_ms, "error": str(e)}
-            time.sleep(0.5 * attempt)
-
-
-def log_query(model: str, endpoint: str, prompt: str, response_len: int, latency_ms: int, error: str = ""):
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.loop_monitor.cancel()
+    await close_client()
+    log_writer.close()
+
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    """Time every request and label model calls made while serving it with the endpoint."""
+    token = current_endpoint.set(request.url.path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        current_endpoint.reset(token)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text-format metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/upstreams")
+async def get_upstreams():
+    """Circuit breaker state and adaptive concurrency limit per model."""
+    return upstreams.snapshot()
+
+
+@app.get("/router")
+async def get_router():
+    """Latency estimates per deployment and hedge/win rates per model."""
+    return router.snapshot()
+
+
+@app.post("/projects/reload")
+async def reload_project_data():
+    """Re-read projects.json, rebuild the retrieval indexes and drop cached answers of changed projects."""
+    changed = await asyncio.to_thread(reload_projects, PROJECTS, PROJECTS_PATH)
+    for pid in changed:
+        semantic_cache.invalidate_project(pid)
+    return {"projects": len(PROJECTS), "changed": changed}
+
+
+def log_query(model: str, endpoint: str, prompt: str, response_len: int, latency_ms: int, error: str = "",
+              cache: str = "", ttft_ms: int = None, tokens_per_s: float = None):
     ts = int(time.time())
-    with open(LOG_FILEPATH, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([ts, model, endpoint, prompt.replace(
-            "\n", " "), response_len, latency_ms, error])
+    log_writer.write([ts, model, endpoint, prompt.replace(
+        "\n", " "), response_len, latency_ms, error, cache,
+        "" if ttft_ms is None else ttft_ms, "" if tokens_per_s is None else tokens_per_s])
 
 
 def extract_content_from_completion(resp: Dict[str, Any]) -> str:
@@ -95,6 +150,9 @@ def extract_content_from_completion(resp: Dict[str, Any]) -> str:
     """
     if resp is None:
         return ""
+    # litellm returns pydantic ModelResponse objects; read them as dicts
+    if hasattr(resp, "model_dump"):
+        resp = resp.model_dump()
     # Try common shape used earlier in examples
     try:
         # litellm may return {'choices': [{'message': {'content': '...'}}]}
@@ -117,109 +175,138 @@ def extract_content_from_completion(resp: Dict[str, Any]) -> str:
         return ""
 
 
-@app.post("/query")
-async def query_model(request: QueryRequest):
-    """
-    Basic model query endpoint. If project_id is provided, we use RAG to add context.
-    """
-    model = request.model
-    prompt = request.prompt
-    project_id = request.project_id
+def project_context(project_id: str, query: str, model: str) -> PackedContext:
+    """Retrieved milestones for `query`, de-duplicated and packed into the token budget for `model`."""
+    if not project_id:
+        return pack_context([], model)
+    docs = retrieve_relevant_docs(PROJECTS, project_id, query, top_k=CONTEXT_TOP_K)
+    packed = pack_context(docs, model)
+    endpoint = current_endpoint.get()
+    CONTEXT_TOKENS.inc(packed.tokens, endpoint=endpoint, kind="sent")
+    CONTEXT_TOKENS.inc(packed.tokens_saved, endpoint=endpoint, kind="saved")
+    return packed
+
 
+def build_query_messages(prompt: str, project_id: str = None, model: str = None):
+    """System + user messages for /query, with packed project context when grounding."""
     # Construct system + user messages using prompt template
     system_prompt = PROMPT_TEMPLATES["system"]
     user_prompt = prompt
 
     # If grounding to a project, retrieve docs and add to context
-    context_snippet = ""
-    if project_id:
-        docs = retrieve_relevant_docs(PROJECTS, project_id, prompt, top_k=3)
-        context_snippet = "\n\n".join([d["text"] for d in docs])
-        user_prompt = f"Project context:\n{context_snippet}\n\nUser question:\n{prompt}"
+    context = project_context(project_id, prompt, model)
+    if context.text:
+        user_prompt = f"Project context:\n{context.text}\n\nUser question:\n{prompt}"
 
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt}
     ]
+    return messages, context
 
-    called = call_model(model, messages)
+
+@app.post("/query")
+async def query_model(request: QueryRequest):
+    """
+    Basic model query endpoint. If project_id is provided, we use RAG to add context.
+    """
+    start = time.time()
+    model = request.model
+    prompt = request.prompt
+    project_id = request.project_id
+
+    # Semantic cache: reuse the answer to a near-identical earlier question
+    scope = f"/query|{model}|{project_id or ''}"
+    fingerprint = project_fingerprint(PROJECTS, project_id)
+    vec = None
+    if request.use_cache and semantic_cache.enabled:
+        vec = await semantic_cache.embed(prompt)
+        if vec is not None:
+            hit, similarity = semantic_cache.lookup(scope, fingerprint, vec)
+            if hit:
+                LLM_CACHE.inc(model=model, endpoint="/query", result="semantic")
+                latency_ms = int((time.time() - start) * 1000)
+                log_query(model=model, endpoint="/query", prompt=prompt, response_len=len(hit["response"]),
+                          latency_ms=latency_ms, cache="semantic")
+                return {"model": model, **hit, "latency_ms": latency_ms, "cache": "semantic",
+                        "similarity": round(similarity, 4)}
+
+    messages, context = build_query_messages(prompt, project_id, model)
+    context_snippet = context.text
+
+    called = await call_model(model, messages, use_cache=request.use_cache)
     resp, latency_ms, error = called["resp"], called["latency_ms"], called["error"]
     content = extract_content_from_completion(resp)
     response_len = len(content)
 
     # logging / observability
     log_query(model=model, endpoint="/query", prompt=prompt,
-              response_len=response_len, latency_ms=latency_ms, error=error or "")
+              response_len=response_len, latency_ms=latency_ms, error=error or "", cache=called["cache"])
 
     if error:
         raise HTTPException(status_code=500, detail={"error": error})
 
-    return {"model": model, "response": content, "latency_ms": latency_ms, "grounding": bool(project_id), "context_snippet": context_snippet}
+    if vec is not None:
+        semantic_cache.store(scope, fingerprint, vec, {"response": content, "grounding": bool(project_id),
+                                                       "context_snippet": context_snippet,
+                                                       "context_tokens": context.report()})
+
+    return {"model": model, "response": content, "latency_ms": latency_ms, "grounding": bool(project_id), "context_snippet": context_snippet, "context_tokens": context.report(), "cache": called["cache"]}
 
 
 @app.post("/eval")
 async def eval_models(request: EvalRequest):
     """
-    Compare outputs of two models for the same prompt and return both responses.
+    Compare outputs of several models for the same prompt and return every response.
+    Models are called concurrently; a slow or failing one does not block the rest.
     """
     prompt = request.prompt
-    model_a = request.model_a
-    model_b = request.model_b
+    models = [m for m in [request.model_a, request.model_b, *request.models] if m]
     project_id = request.project_id
+    if not models:
+        raise HTTPException(status_code=400, detail={"error": "no models to compare"})
 
-    # Optionally retrieve context
-    context_snippet = ""
-    if project_id:
-        docs = retrieve_relevant_docs(PROJECTS, project_id, prompt, top_k=3)
-        context_snippet = "\n\n".join([d["text"] for d in docs])
+    # Optionally retrieve context; every model gets the same prompt, packed for the first one
+    context = project_context(project_id, prompt, models[0])
+    context_snippet = context.text
+    if context_snippet:
         prompt = f"Project context:\n{context_snippet}\n\nUser question:\n{prompt}"
 
     messages = [{"role": "system", "content": PROMPT_TEMPLATES["system"]},
                 {"role": "user", "content": prompt}]
 
-    # Run both models (sequentially for now)
+    # Run all models concurrently
+    compared = await compare_models(models, messages, deadline=request.deadline_s or COMPARE_DEADLINE_S,
+                                    use_cache=request.use_cache)
     result = {}
-    for m in [model_a, model_b]:
-        called = call_model(m, messages)
+    for m, called in compared.items():
         resp, latency_ms, error = called["resp"], called["latency_ms"], called["error"]
         content = extract_content_from_completion(resp)
         result[m] = {"response": content,
-                     "latency_ms": latency_ms, "error": error}
+                     "latency_ms": latency_ms, "error": error, "cache": called["cache"]}
         log_query(model=m, endpoint="/eval", prompt=request.prompt,
-                  response_len=len(content), latency_ms=latency_ms, error=error or "")
+                  response_len=len(content), latency_ms=latency_ms, error=error or "", cache=called["cache"])
 
-    return {"prompt": request.prompt, "project_id": project_id, "responses": result, "context_snippet": context_snippet}
+    return {"prompt": request.prompt, "project_id": project_id, "responses": result, "context_snippet": context_snippet,
+            "context_tokens": context.report()}
 
 
-@app.post("/agent")
-async def agent(request: AgentRequest):
-    """
-    Simple agent that can use a small set of tools:
-    - retrieve project context (RAG)
-    - run a number-fact tool (via numbersapi)
-    - perform a small internal calc tool (eval)
-    The agent will be asked to plan steps and produce a final answer.
-    """
-    model = request.model
-    task = request.task
-    project_id = request.project_id
-
+async def run_agent_tools(task: str, project_id: str = None, model: str = None) -> List[Dict[str, str]]:
+    """Run the agent's tools (RAG, numbersapi, calc) for a task and collect their outputs."""
     # Simple tool outputs
     tool_outputs = []
     # RAG tool
     if project_id:
-        docs = retrieve_relevant_docs(PROJECTS, project_id, task, top_k=3)
-        rag_text = "\n\n".join([d["text"] for d in docs])
+        rag_text = project_context(project_id, task, model).text
         tool_outputs.append({"tool": "rag", "output": rag_text})
     # number tool
     import re
-    import requests
     nums = re.findall(r"\b\d+\b", task)
     if nums:
         n = nums[0]
         try:
-            fact = requests.get(
-                f"http://numbersapi.com/{n}/math", timeout=5).text
+            fact = (await get_client().get(
+                f"{NUMBERS_API_BASE}/{n}/math", timeout=5)).text
             tool_outputs.append({"tool": "numbersapi", "output": fact})
         except Exception:
             tool_outputs.append(
@@ -236,6 +323,10 @@ async def agent(request: AgentRequest):
             except Exception:
                 pass
 
+    return tool_outputs
+
+
+def build_agent_messages(task: str, tool_outputs: List[Dict[str, str]]) -> List[Dict[str, str]]:
     # Build prompt for the agent model
     tool_desc = "\n".join(
         [f"[{t['tool']}]: {t['output']}" for t in tool_outputs]) or "No tools used."
@@ -243,27 +334,106 @@ async def agent(request: AgentRequest):
 
     messages = [{"role": "system", "content": PROMPT_TEMPLATES["agent_system"]},
                 {"role": "user", "content": agent_input}]
+    return messages
+
+
+@app.post("/agent")
+async def agent(request: AgentRequest):
+    """
+    Simple agent that can use a small set of tools:
+    - retrieve project context (RAG)
+    - run a number-fact tool (via numbersapi)
+    - perform a small internal calc tool (eval)
+    The agent will be asked to plan steps and produce a final answer.
+    """
+    model = request.model
+    task = request.task
+    project_id = request.project_id
+
+    tool_outputs = await run_agent_tools(task, project_id, model)
+    messages = build_agent_messages(task, tool_outputs)
 
-    called = call_model(model, messages)
+    called = await call_model(model, messages, use_cache=request.use_cache)
     resp, latency_ms, error = called["resp"], called["latency_ms"], called["error"]
     content = extract_content_from_completion(resp)
 
     log_query(model=model, endpoint="/agent", prompt=task,
-              response_len=len(content), latency_ms=latency_ms, error=error or "")
+              response_len=len(content), latency_ms=latency_ms, error=error or "", cache=called["cache"])
 
     if error:
         raise HTTPException(status_code=500, detail={"error": error})
 
-    return {"model": model, "response": content, "tool_outputs": tool_outputs, "latency_ms": latency_ms}
+    return {"model": model, "response": content, "tool_outputs": tool_outputs, "latency_ms": latency_ms, "cache": called["cache"]}
+
+
+async def sse_model_stream(model: str, messages: List[Dict[str, str]], endpoint: str, prompt: str,
+                           use_cache: bool, meta: Dict[str, Any]):
+    """
+    Server-sent events for one streamed completion: a "meta" event, one
+    "token" event per delta, then "done" (or "error") with latency, time to
+    first token and tokens/sec, which are also written to the query log.
+    """
+    yield sse_event("meta", meta)
+    stats = {}
+    length = 0
+    async for delta in stream_model(model, messages, use_cache=use_cache, stats=stats):
+        length += len(delta)
+        yield sse_event("token", {"text": delta})
+    log_query(model=model, endpoint=endpoint, prompt=prompt, response_len=length, latency_ms=stats["latency_ms"],
+              error=stats["error"] or "", cache=stats["cache"], ttft_ms=stats["ttft_ms"],
+              tokens_per_s=stats["tokens_per_s"])
+    yield sse_event("error" if stats["error"] else "done", stats)
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.post("/query/stream")
+async def query_model_stream(request: QueryRequest):
+    """Streaming variant of /query (server-sent events)."""
+    messages, context = build_query_messages(request.prompt, request.project_id, request.model)
+    meta = {"model": request.model, "grounding": bool(request.project_id), "context_snippet": context.text,
+            "context_tokens": context.report()}
+    events = sse_model_stream(request.model, messages, "/query/stream", request.prompt, request.use_cache, meta)
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.post("/agent/stream")
+async def agent_stream(request: AgentRequest):
+    """Streaming variant of /agent: tools run first, then the answer streams (server-sent events)."""
+    tool_outputs = await run_agent_tools(request.task, request.project_id, request.model)
+    messages = build_agent_messages(request.task, tool_outputs)
+    meta = {"model": request.model, "tool_outputs": tool_outputs}
+    events = sse_model_stream(request.model, messages, "/agent/stream", request.task, request.use_cache, meta)
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.get("/logs")
-async def get_logs():
+async def get_logs(since: int = None, until: int = None, model: str = None, endpoint: str = None,
+                   error: bool = None, cursor: str = None, limit: int = Query(100, ge=1, le=1000)):
     """
-    Return CSV logs as text (small scale). In production, you'd expose via a secure storage.
+    Return one page of log rows (oldest first) matching the filters.
+    since/until are unix timestamps; error=true/false keeps only failed/successful calls.
+    Pass the returned next_cursor to get the following page.
     """
-    if not os.path.exists(LOG_FILEPATH):
+    try:
+        return await asyncio.to_thread(log_store.page, limit=limit, since=since, until=until, model=model,
+                                       endpoint=endpoint, error=error, cursor=cursor)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="No logs found.")
-    with open(LOG_FILEPATH, "r", encoding="utf-8") as f:
-        data = f.read()
-    return {"csv": data}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+@app.get("/logs/export")
+async def export_logs(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), since: int = None,
+                      until: int = None, model: str = None, endpoint: str = None, error: bool = None):
+    """
+    Stream every matching row as NDJSON or CSV. Rows are read lazily, so memory stays flat
+    regardless of log size.
+    """
+    rows = log_store.export(fmt=format, fields=LOG_FIELDS, since=since, until=until, model=model,
+                            endpoint=endpoint, error=error)
+    media = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f"attachment; filename=query_logs.{format}"}
+    return StreamingResponse(rows, media_type=media, headers=headers)
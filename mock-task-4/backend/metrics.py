@@ -0,0 +1,172 @@
+# backend/metrics.py
+import time
+import bisect
+import asyncio
+import threading
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+# Endpoint of the request being served; set by the HTTP middleware so
+# call_model can label its metrics without threading it through every call.
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="")
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 4, 6, 8, 12, 20, 30, 60)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                le = _labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {running}")
+            running += counts[-1]
+            le = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# --- metrics recorded by the gateway and the HTTP middleware ---
+
+LLM_REQUESTS = Counter("llm_requests_total", "Model calls by outcome.", ("model", "endpoint", "status"))
+LLM_LATENCY = Histogram("llm_request_latency_seconds", "Upstream model call latency.", ("model", "endpoint"))
+LLM_TTFT = Histogram("llm_time_to_first_token_seconds", "Time to first streamed token.", ("model", "endpoint"))
+LLM_RETRIES = Counter("llm_retries_total", "Model call retries.", ("model", "endpoint"))
+LLM_ERRORS = Counter("llm_errors_total", "Failed model call attempts by exception type.",
+                     ("model", "endpoint", "error_type"))
+LLM_TOKENS = Counter("llm_tokens_total", "Prompt and completion tokens.", ("model", "endpoint", "kind"))
+LLM_CACHE = Counter("llm_cache_total", "Response cache lookups by result.", ("model", "endpoint", "result"))
+LLM_COALESCED = Counter("llm_coalesced_total", "Model calls answered by an identical call already in flight.",
+                        ("model", "endpoint"))
+CONTEXT_TOKENS = Counter("rag_context_tokens_total", "Retrieved-context tokens sent to models and saved by packing.",
+                         ("endpoint", "kind"))
+LLM_ROUTED = Counter("llm_routed_total", "Upstream calls per logical model and deployment (hedges included).",
+                     ("model", "deployment"))
+LLM_HEDGED = Counter("llm_hedged_total", "Calls that sent a hedged duplicate to a second deployment.", ("model",))
+LLM_HEDGE_WINS = Counter("llm_hedge_wins_total", "Which side answered first in a hedged call.", ("model", "winner"))
+CIRCUIT_STATE = Gauge("upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open).",
+                      ("upstream",))
+CIRCUIT_REJECTED = Counter("upstream_circuit_rejected_total", "Calls failed fast by an open circuit.", ("upstream",))
+CONCURRENCY_LIMIT = Gauge("upstream_concurrency_limit", "Adaptive cap on concurrent calls per upstream.", ("upstream",))
+UPSTREAM_INFLIGHT = Gauge("upstream_inflight", "Model calls in flight per upstream.", ("upstream",))
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests served.", ("endpoint", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ("endpoint", "method"))
+EVENT_LOOP_LAG = Histogram("event_loop_lag_seconds", "How late the event loop woke a periodic timer.",
+                           buckets=LAG_BUCKETS)
+
+
+async def monitor_event_loop(interval: float = 0.05):
+    """Observe event-loop lag forever: the delay between when a sleep should end and when it does."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+def record_usage(model: str, endpoint: str, resp) -> None:
+    """Count prompt/completion tokens from a litellm response (object or dict)."""
+    usage = getattr(resp, "usage", None)
+    if usage is None and isinstance(resp, dict):
+        usage = resp.get("usage")
+    if not usage:
+        return
+    get = usage.get if isinstance(usage, dict) else (lambda k: getattr(usage, k, None))
+    for kind in ("prompt", "completion"):
+        n = get(f"{kind}_tokens")
+        if n:
+            LLM_TOKENS.inc(n, model=model, endpoint=endpoint, kind=kind)
@@ -1,7 +1,12 @@
 # backend/rag_utils.py
 import json
+import math
+import hashlib
+import re
+from collections import Counter, defaultdict
 from typing import List, Dict
 import os
+import numpy as np
 
 # Very small prompt templates; keep modular for quick changes
 PROMPT_TEMPLATES = {
@@ -9,6 +14,92 @@ PROMPT_TEMPLATES = {
     "agent_system": "You are an agent that should use available tools and project context to perform multi-step reasoning. Be explicit about steps and final answer."
 }
 
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def milestone_text(m: Dict) -> str:
+    return f"{m.get('date','')}: {m.get('title','')} - {m.get('notes','')}"
+
+
+class BM25Index:
+    """
+    Inverted index over one project's milestones, built once at load time.
+    Each posting stores its full BM25 term weight (idf and length
+    normalisation folded in), so a query only sums weights over the
+    postings of its own terms.
+    """
+
+    def __init__(self, texts: List[str], k1: float = 1.2, b: float = 0.75):
+        self.texts = texts
+        self.doc_len = []
+        raw = defaultdict(list)
+        for i, text in enumerate(texts):
+            tf = Counter(tokenize(text))
+            self.doc_len.append(sum(tf.values()))
+            for tok, count in tf.items():
+                raw[tok].append((i, count))
+        n = len(texts)
+        self.avgdl = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {}
+        self.postings = {}
+        for tok, plist in raw.items():
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            self.idf[tok] = idf
+            ids = np.array([i for i, _ in plist], dtype="int64")
+            tf = np.array([c for _, c in plist], dtype="float64")
+            dl = np.array([self.doc_len[i] for i in ids], dtype="float64")
+            self.postings[tok] = (ids, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / self.avgdl)))
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+        scores = np.zeros(len(self.texts))
+        for tok in set(tokenize(query)):
+            posting = self.postings.get(tok)
+            if posting is not None:
+                ids, weights = posting
+                scores[ids] += weights  # ids are unique within one posting list
+        matched = np.flatnonzero(scores)  # ascending milestone order
+        k = min(top_k, len(matched))
+        top = matched[:0]
+        if k:
+            # top-k without a full sort; at the cut-off score, earlier milestones win ties
+            cutoff = scores[matched[np.argpartition(-scores[matched], k - 1)[k - 1]]]
+            above = matched[scores[matched] > cutoff]
+            top = np.concatenate([above, matched[scores[matched] == cutoff][:k - len(above)]])
+            top = top[np.lexsort((top, -scores[top]))]
+        hits = [{"text": self.texts[i], "score": round(float(scores[i]), 4)} for i in top]
+        # like before, always return top_k items when the project has them
+        if len(hits) < top_k:
+            for i, text in enumerate(self.texts):
+                if len(hits) >= top_k:
+                    break
+                if scores[i] == 0:
+                    hits.append({"text": text, "score": 0.0})
+        return hits
+
+
+def build_project_index(project: Dict) -> BM25Index:
+    milestones = project.get("milestones", [])
+    index = BM25Index([milestone_text(m) for m in milestones])
+    project["_index"] = index
+    # changes whenever the milestones do; caches key their entries on it
+    project["_fingerprint"] = hashlib.sha256(
+        json.dumps(milestones, sort_keys=True).encode("utf-8")).hexdigest()
+    return index
+
+
+def project_fingerprint(projects: Dict[str, Dict], project_id: str) -> str:
+    project = projects.get(project_id) if project_id else None
+    if not project:
+        return ""
+    if "_fingerprint" not in project:
+        build_project_index(project)
+    return project["_fingerprint"]
+
+
 def load_projects(path: str):
     """
     Loads a small JSON file of projects. Each project has id, name, and a list of events/milestones
@@ -23,24 +114,34 @@ def load_projects(path: str):
         data = json.load(f)
     # Normalize into list of docs
     projects = {p["id"]: p for p in data.get("projects", [])}
+    # Pre-tokenize every project's milestones once so retrieval is cheap
+    for p in projects.values():
+        build_project_index(p)
     return projects
 
+
+def reload_projects(projects: Dict[str, Dict], path: str) -> List[str]:
+    """
+    Re-read the projects file into `projects` (in place, so existing references
+    see the new data) and return the ids whose milestones were added, removed
+    or changed. Indexes and fingerprints are rebuilt by load_projects.
+    """
+    fresh = load_projects(path)
+    changed = [pid for pid in set(projects) | set(fresh)
+               if project_fingerprint(projects, pid) != project_fingerprint(fresh, pid)]
+    # swap per key, never clear(): concurrent lookups see either the old or the new project
+    projects.update(fresh)
+    for pid in set(projects) - set(fresh):
+        projects.pop(pid, None)
+    return sorted(changed)
+
 def retrieve_relevant_docs(projects: Dict[str, Dict], project_id: str, query: str, top_k: int = 3) -> List[Dict]:
     """
-    Very simple retriever: scores milestone text by overlap with query tokens.
+    BM25 retriever over the project's precomputed inverted index.
     For the practice task this is sufficient; in real life you'd use embeddings + vector DB.
     """
     project = projects.get(project_id)
     if not project:
         return []
-    items = project.get("milestones", [])
-    qtokens = set(query.lower().split())
-    scored = []
-    for m in items:
-        text = f"{m.get('date','')}: {m.get('title','')} - {m.get('notes','')}"
-        tokens = set(text.lower().split())
-        score = len(qtokens.intersection(tokens))
-        scored.append({"text": text, "score": score})
-    # sort by score desc, fallback to chronological
-    scored_sorted = sorted(scored, key=lambda x: (-x["score"], x["text"]))[:top_k]
-    return scored_sorted
+    index = project.get("_index") or build_project_index(project)
+    return index.search(query, top_k=top_k)
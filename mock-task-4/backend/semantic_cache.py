@@ -0,0 +1,109 @@
+# backend/semantic_cache.py
+import os
+import logging
+from typing import Any, Dict, Optional, Tuple
+import faiss
+import litellm
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("semantic_cache")
+
+API_BASE = os.getenv("LITELLM_API_BASE", "http://localhost:4000")
+
+
+class SemanticCache:
+    """
+    Answers near-duplicate questions from earlier answers.
+
+    Entries live in small per-scope FAISS inner-product indexes over
+    normalised prompt embeddings (a scope is e.g. endpoint + model +
+    project). Every scope remembers the fingerprint of the project data
+    it was built from; a lookup or store with a different fingerprint
+    drops the scope, so answers never outlive the milestones they used.
+
+    ada-002 cosine similarities bunch up between ~0.7 and 1.0: two
+    different questions about the same project often score above 0.92,
+    while rewordings of one question mostly land at 0.97 or higher. The
+    default threshold is therefore 0.97; lower it only after checking
+    false hits on real traffic.
+    """
+
+    def __init__(self, embed_model: str = "text-embedding-ada-002", threshold: float = 0.97,
+                 max_entries: int = 1000, enabled: bool = True):
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._scopes: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        return cls(
+            embed_model=os.getenv("SEMANTIC_CACHE_EMBED_MODEL", "text-embedding-ada-002"),
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")),
+            enabled=os.getenv("SEMANTIC_CACHE", "on").lower() not in ("0", "off", "false"),
+        )
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """Normalised embedding of `text`, or None if embedding fails (the cache is then skipped)."""
+        try:
+            resp = await litellm.aembedding(model=self.embed_model, input=[text], api_base=API_BASE,
+                                            api_key=os.getenv("LITELLM_API_KEY"))
+        except Exception as e:
+            logger.warning(f"Semantic cache embedding failed: {e}")
+            return None
+        vec = np.asarray([resp["data"][0]["embedding"]], dtype="float32")
+        faiss.normalize_L2(vec)
+        return vec
+
+    def _scope(self, scope: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        entry = self._scopes.get(scope)
+        if entry and entry["fingerprint"] != fingerprint:
+            del self._scopes[scope]
+            self.stats["invalidations"] += 1
+            return None
+        return entry
+
+    def lookup(self, scope: str, fingerprint: str, vec: np.ndarray) -> Tuple[Optional[Any], float]:
+        """Return (stored value, similarity) for the closest past prompt, or (None, similarity)."""
+        entry = self._scope(scope, fingerprint)
+        if entry is None or entry["index"].ntotal == 0:
+            self.stats["misses"] += 1
+            return None, 0.0
+        D, I = entry["index"].search(vec, 1)
+        sim, i = float(D[0][0]), int(I[0][0])
+        if i >= 0 and sim >= self.threshold:
+            self.stats["hits"] += 1
+            return entry["values"][i], sim
+        self.stats["misses"] += 1
+        return None, sim
+
+    def store(self, scope: str, fingerprint: str, vec: np.ndarray, value: Any):
+        entry = self._scope(scope, fingerprint)
+        if entry is None:
+            entry = {"fingerprint": fingerprint, "index": faiss.IndexFlatIP(vec.shape[1]), "values": []}
+            self._scopes[scope] = entry
+        if entry["index"].ntotal >= self.max_entries:
+            # drop the oldest tenth; IndexFlat renumbers the remaining ids
+            drop = max(1, self.max_entries // 10)
+            entry["index"].remove_ids(faiss.IDSelectorRange(0, drop))
+            del entry["values"][:drop]
+        entry["index"].add(vec)
+        entry["values"].append(value)
+
+    def invalidate(self, match: str = ""):
+        """Drop every scope whose name contains `match` (all scopes by default)."""
+        for scope in [s for s in self._scopes if match in s]:
+            del self._scopes[scope]
+            self.stats["invalidations"] += 1
+
+    def invalidate_project(self, project_id: str):
+        """Drop the scopes of one project (scope names end with "|<project_id>")."""
+        for scope in [s for s in self._scopes if s.rsplit("|", 1)[-1] == project_id]:
+            del self._scopes[scope]
+            self.stats["invalidations"] += 1
@@ -1,8 +1,9 @@
 # frontend/app.py
+import json
 import streamlit as st
 import requests
 import pandas as pd
-from io import StringIO
+from urllib.parse import urlencode
 
 API = "http://localhost:8000"
 
@@ -18,6 +19,44 @@ project_choices = {
     "City Mall Renovation (proj_B)": "proj_B"
 }
 
+
+
+def iter_sse(resp):
+    """Yield (event, data) pairs from a server-sent-events response."""
+    event, data = None, []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and data:
+            yield event or "message", json.loads("\n".join(data))
+            event, data = None, []
+
+
+def render_stream(url, payload):
+    """Post to a streaming endpoint and render tokens as they arrive; returns the meta event."""
+    meta = {}
+    placeholder = st.empty()
+    answer = ""
+    with requests.post(url, json=payload, stream=True, timeout=120) as r:
+        if r.status_code != 200:
+            st.error(r.text)
+            return meta
+        for event, data in iter_sse(r):
+            if event == "meta":
+                meta = data
+            elif event == "token":
+                answer += data["text"]
+                placeholder.write(answer)
+            elif event == "done":
+                st.write(f"Latency: {data['latency_ms']} ms · first token: {data['ttft_ms']} ms · "
+                         f"{data['tokens_per_s']} tokens/s")
+            elif event == "error":
+                st.error(data.get("error"))
+    return meta
+
+
 tab = st.tabs(["Chat", "Compare & Eval", "Agent (RAG)", "Logs & Export"])[0]  # we'll use manual sections below
 
 # Chat section
@@ -27,9 +66,14 @@ with col1:
     model_choice = st.selectbox("Select model", models, index=0)
     project_choice = st.selectbox("Ground answers on project", list(project_choices.keys()))
     user_prompt = st.text_area("Prompt", height=150)
+    stream_chat = st.checkbox("Stream tokens", value=True, key="stream_chat")
     if st.button("Run Chat"):
         if not user_prompt.strip():
             st.warning("Please enter a prompt.")
+        elif stream_chat:
+            payload = {"model": model_choice, "prompt": user_prompt, "project_id": project_choices[project_choice]}
+            st.success("Response:")
+            render_stream(f"{API}/query/stream", payload)
         else:
             payload = {"model": model_choice, "prompt": user_prompt, "project_id": project_choices[project_choice]}
             r = requests.post(f"{API}/query", json=payload)
@@ -84,33 +128,65 @@ st.header("🕵️ Agent (RAG-enabled)")
 agent_model = st.selectbox("Agent model", models, index=0, key="agent_model")
 agent_project = st.selectbox("Ground agent on project", list(project_choices.keys()), key="agent_proj")
 agent_task = st.text_input("Agent task (e.g., 'Assess critical path risk for Project A')", key="agent_task")
+stream_agent = st.checkbox("Stream tokens", value=True, key="stream_agent")
 if st.button("Run Agent"):
     payload = {"model": agent_model, "task": agent_task, "project_id": project_choices[agent_project]}
-    r = requests.post(f"{API}/agent", json=payload)
-    if r.status_code == 200:
-        d = r.json()
-        st.subheader("Tool outputs")
-        st.json(d.get("tool_outputs", []))
+    if stream_agent:
         st.subheader("Agent response")
-        st.write(d.get("response", ""))
-        st.write(f"Latency: {d.get('latency_ms')} ms")
+        meta = render_stream(f"{API}/agent/stream", payload)
+        st.subheader("Tool outputs")
+        st.json(meta.get("tool_outputs", []))
     else:
-        st.error(r.text)
+        r = requests.post(f"{API}/agent", json=payload)
+        if r.status_code == 200:
+            d = r.json()
+            st.subheader("Tool outputs")
+            st.json(d.get("tool_outputs", []))
+            st.subheader("Agent response")
+            st.write(d.get("response", ""))
+            st.write(f"Latency: {d.get('latency_ms')} ms")
+        else:
+            st.error(r.text)
 
 # Logs & export
 st.markdown("---")
 st.header("📥 Logs & Export")
-if st.button("Fetch logs"):
-    r = requests.get(f"{API}/logs")
+log_col1, log_col2, log_col3 = st.columns(3)
+with log_col1:
+    log_model = st.text_input("Filter by model", key="log_model")
+with log_col2:
+    log_endpoint = st.selectbox("Filter by endpoint",
+                                ["Any", "/query", "/query/stream", "/eval", "/agent", "/agent/stream"],
+                                key="log_endpoint")
+with log_col3:
+    log_error = st.selectbox("Errors", ["Any", "Only errors", "No errors"], key="log_error")
+log_filters = {}
+if log_model.strip():
+    log_filters["model"] = log_model.strip()
+if log_endpoint != "Any":
+    log_filters["endpoint"] = log_endpoint
+if log_error != "Any":
+    log_filters["error"] = str(log_error == "Only errors").lower()
+
+if "log_cursor" not in st.session_state:
+    st.session_state.log_cursor = None
+fetch_col, next_col = st.columns(2)
+with fetch_col:
+    fetch_first = st.button("Fetch logs")
+with next_col:
+    fetch_next = st.button("Next page", disabled=not st.session_state.log_cursor)
+if fetch_first or fetch_next:
+    params = dict(log_filters, limit=200)
+    if fetch_next:
+        params["cursor"] = st.session_state.log_cursor
+    r = requests.get(f"{API}/logs", params=params)
     if r.status_code == 200:
-        csv_text = r.json().get("csv", "")
-        st.text_area("Raw CSV", csv_text, height=200)
-        try:
-            df = pd.read_csv(StringIO(csv_text))
-            st.dataframe(df)
-            csv_bytes = csv_text.encode("utf-8")
-            st.download_button("Download logs CSV", csv_bytes, file_name="query_logs.csv")
-        except Exception as e:
-            st.error(f"Failed to parse CSV: {e}")
+        page = r.json()
+        st.session_state.log_cursor = page.get("next_cursor")
+        st.dataframe(pd.DataFrame(page.get("rows", [])))
+        if page.get("partial_scan"):
+            st.info("Scanned a large stretch of the log without enough matches; press Next page to keep searching.")
     else:
         st.error(r.text)
+export_query = urlencode(dict(log_filters, format="csv"))
+st.markdown(f"[Download matching logs as CSV]({API}/logs/export?{export_query})")
@@ -1,39 +1,18 @@
-import litellm
 import logging
 from rag_utils import PROMPT_TEMPLATES
 from typing import List, Dict, Any
-import os
-from dotenv import load_dotenv
-import time
-
-load_dotenv()
+from gateway import call_model, compare_models, COMPARE_DEADLINE_S
 
 logger = logging.getLogger("agents")
 logging.basicConfig(level=logging.INFO)
 
 
-def call_model(model_name: str, messages: List[Dict[str, str]], timeout: int = 60, max_retries: int = 2) -> Dict[str, Any]:
-    attempt = 0
-    while True:
-        attempt += 1
-        start = time.time()
-        try:
-            resp = litellm.completion(
-                model=model_name, messages=messages, timeout=timeout, api_base="http://localhost:4000",
-                api_key=os.getenv("LITELLM_API_KEY"))
-            latency = int((time.time() - start) * 1000)
-            return {"resp": resp, "latency": latency, "error": None}
-        except Exception as e:
-            latency = int((time.time() - start) * 1000)
-            logger.exception(f"call_model error on {model_name}: {e}")
-            if attempt > max_retries:
-                return {"resp": None, "latency": latency, "error": str(e)}
-            time.sleep(0.5 * attempt)
-
-
 def extract_text(resp: Any) -> str:
     if not resp:
         return ""
+    # litellm returns pydantic ModelResponse objects; read them as dicts
+    if hasattr(resp, "model_dump"):
+        resp = resp.model_dump()
     try:
         if isinstance(resp, dict) and "choices" in resp and len(resp["choices"]) > 0:
             ch = resp["choices"][0]
@@ -76,58 +55,71 @@ def retriever_agent(projects: Dict, project_id: str, query: str, top_k: int = 3)
 # --- Forecaster ---
 
 
-def forecaster_agent(docs: List[Dict], query: str, model: str) -> Dict:
+def forecaster_messages(docs: List[Dict], query: str) -> List[Dict[str, str]]:
     context = "\n".join([d["text"] for d in docs])
-    messages = [
+    return [
         {"role": "system", "content": PROMPT_TEMPLATES["forecaster"]},
         {"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{query}"}
     ]
-    resp = litellm.completion(model=model, messages=messages, api_base="http://localhost:4000",
-                              api_key=os.getenv("LITELLM_API_KEY"))
-    answer = resp["choices"][0]["message"]["content"]
-    return {"model": model, "forecast": answer}
 
-# --- Evaluator ---
 
+async def forecaster_agent(docs: List[Dict], query: str, model: str, use_cache: bool = True) -> Dict:
+    messages = forecaster_messages(docs, query)
+    called = await call_model(model, messages, use_cache=use_cache)
+    answer = extract_text(called["resp"])
+    return {"model": model, "forecast": answer, "latency_ms": called["latency_ms"], "error": called["error"],
+            "cache": called["cache"]}
 
-def evaluator_agent(query: str, docs: List[Dict], model_a: str, model_b: str) -> Dict:
-    context = "\n".join([d["text"] for d in docs])
-    responses = {}
-    for m in [model_a, model_b]:
-        msgs = [
-            {"role": "system", "content": PROMPT_TEMPLATES["system"]},
-            {"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{query}"}
-        ]
-        called = call_model(m, msgs)
-        text = extract_text(called["resp"])
-        responses[m] = {"text": text, "latency_ms":
-                        called["latency"], "error": called["error"]}
+# --- Evaluator ---
 
-    def score_response(text: str) -> float:
-        if not text:
-            return 0.0
-        s = 0.0
 
-        low = text.lower()
-        if "delay" in low or "delayed" in low:
-            s += 0.4
-        if "week" in low or "weeks" in low:
-            s += 0.3
-        if "confidence" in low or "%" in low:
-            s += 0.2
+def score_response(text: str) -> float:
+    if not text:
+        return 0.0
+    s = 0.0
+
+    low = text.lower()
+    if "delay" in low or "delayed" in low:
+        s += 0.4
+    if "week" in low or "weeks" in low:
+        s += 0.3
+    if "confidence" in low or "%" in low:
+        s += 0.2
+
+    L = len(text.split())
+    if 30 <= L <= 300:
+        s += 0.2
+    elif L < 30:
+        s += 0.1
+    else:
+        s += 0.0
 
-        L = len(text.split())
-        if 30 <= L <= 300:
-            s += 0.2
-        elif L < 30:
-            s += 0.1
-        else:
-            s += 0.0
+    return min(s, 1.0)
 
-        return min(s, 1.0)
 
-    scores = {m: score_response(responses[m]["text"]) for m in responses}
+def evaluator_messages(docs: List[Dict], query: str) -> List[Dict[str, str]]:
+    context = "\n".join([d["text"] for d in docs])
+    return [
+        {"role": "system", "content": PROMPT_TEMPLATES["system"]},
+        {"role": "user", "content": f"Context:\n{context}\n\nQuestion:\n{query}"}
+    ]
 
-    winner = max(scores, key=scores.get)
 
+def score_responses(responses: Dict[str, Dict]) -> Dict:
+    """Score each model's text (failed models are skipped) and pick a winner."""
+    scores = {m: score_response(r["text"]) for m, r in responses.items() if not r["error"]}
+    winner = max(scores, key=scores.get) if scores else None
     return {"responses": responses, "scores": scores, "winner": winner}
+
+
+async def evaluator_agent(query: str, docs: List[Dict], models: List[str],
+                          deadline: float = COMPARE_DEADLINE_S, use_cache: bool = True) -> Dict:
+    """Answer with every model concurrently and score the responses."""
+    msgs = evaluator_messages(docs, query)
+    responses = {}
+    for m, called in (await compare_models(models, msgs, deadline=deadline, use_cache=use_cache)).items():
+        text = extract_text(called["resp"])
+        responses[m] = {"text": text, "latency_ms":
+                        called["latency_ms"], "error": called["error"], "cache": called["cache"]}
+
+    return score_responses(responses)
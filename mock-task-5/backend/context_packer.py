@@ -0,0 +1,143 @@
+import os
+import re
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import litellm
+except ImportError:  # token counts fall back to an estimate
+    litellm = None
+
+logger = logging.getLogger("context_packer")
+
+_WORD_RE = re.compile(r"\S+")
+
+# Default prompt budget for retrieved context (CONTEXT_TOKEN_BUDGET)
+DEFAULT_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Shorter shared runs of words are left alone: they are phrases, not copied spans
+MIN_OVERLAP_WORDS = int(os.getenv("CONTEXT_MIN_OVERLAP_WORDS", "8"))
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Tokens in `text` for `model` via litellm's tokenizer map; about 4 characters per token without it."""
+    if not text:
+        return 0
+    if litellm is not None and model:
+        try:
+            return litellm.token_counter(model=model, text=text)
+        except Exception:
+            logger.debug(f"token_counter failed for {model}; estimating")
+    return len(text) // 4 + 1
+
+
+class PackedContext(NamedTuple):
+    text: str              # the context to put in the prompt
+    docs: List[Dict]       # docs kept, most relevant first, with "text" trimmed of repeated spans
+    tokens: int            # tokens in `text`
+    tokens_in: int         # tokens the plain join of every doc would have used
+    dropped: int           # docs left out (duplicates or over budget)
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_in - self.tokens)
+
+    def report(self) -> Dict[str, int]:
+        return {"tokens": self.tokens, "tokens_in": self.tokens_in, "tokens_saved": self.tokens_saved,
+                "docs": len(self.docs), "dropped": self.dropped}
+
+
+def _words(text: str) -> List[Tuple[int, int, str]]:
+    return [(m.start(), m.end(), m.group()) for m in _WORD_RE.finditer(text)]
+
+
+def _overlap(tail: Sequence[str], head: Sequence[str], min_words: int) -> int:
+    """Length of the longest run that ends `tail` and starts `head` (0 if shorter than min_words)."""
+    if not head:
+        return 0
+    longest = min(len(tail), len(head))
+    for i in range(len(tail) - longest, len(tail) - min_words + 1):
+        if tail[i] == head[0] and list(tail[i:]) == list(head[:len(tail) - i]):
+            return len(tail) - i
+    return 0
+
+
+def _contains(words: Sequence[str], part: Sequence[str]) -> bool:
+    n = len(part)
+    return n > 0 and any(words[i:i + n] == part for i in range(len(words) - n + 1) if words[i] == part[0])
+
+
+def dedupe_spans(texts: List[str], min_words: int = MIN_OVERLAP_WORDS) -> List[Optional[str]]:
+    """
+    Remove text repeated across `texts` (in priority order): a text
+    contained in an earlier one becomes None, and a head or tail it shares
+    with an earlier one (overlapping chunk windows) is cut off it.
+    """
+    kept: List[List[str]] = []
+    out: List[Optional[str]] = []
+    for text in texts:
+        spans = _words(text)
+        words = [w for _, _, w in spans]
+        if not words or any(_contains(k, words) for k in kept):
+            out.append(None)
+            continue
+        start, end = 0, len(words)
+        for k in kept:
+            if start < end:
+                start += _overlap(k, words[start:end], min_words)
+            if start < end:
+                end -= _overlap(words[start:end], k, min_words)
+        if start >= end:
+            out.append(None)
+            continue
+        kept.append(words[start:end])
+        out.append(text[spans[start][0]:spans[end - 1][1]])
+    return out
+
+
+def _truncate(text: str, budget: int, model: Optional[str]) -> str:
+    """Longest word-boundary prefix of `text` within `budget` tokens."""
+    spans = _words(text)
+    lo, hi = 0, len(spans)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:spans[mid - 1][1]], model) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:spans[lo - 1][1]] if lo else ""
+
+
+def pack_context(docs: List[Dict[str, Any]], model: Optional[str] = None, budget: Optional[int] = None,
+                 separator: str = "\n\n", min_overlap_words: int = MIN_OVERLAP_WORDS) -> PackedContext:
+    """
+    Build the context block for a prompt from retrieved docs ({"text",
+    optional "score"}; without scores the given order is the ranking).
+    Repeated spans are removed, then docs are added most relevant first
+    while they fit in `budget` tokens for `model`; a doc that does not fit
+    is skipped in favour of smaller, less relevant ones. If no doc fits,
+    the most relevant one is cut at a word boundary so the context is
+    never empty.
+    """
+    budget = DEFAULT_BUDGET if budget is None else budget
+    if not docs:
+        return PackedContext("", [], 0, 0, 0)
+    tokens_in = count_tokens(separator.join(d["text"] for d in docs), model)
+    ranked = sorted(docs, key=lambda d: -d.get("score", 0.0)) if any("score" in d for d in docs) else list(docs)
+    trimmed = dedupe_spans([d["text"] for d in ranked], min_overlap_words)
+
+    sep_tokens = count_tokens(separator, model)
+    kept, used = [], 0
+    for doc, text in zip(ranked, trimmed):
+        if text is None:
+            continue
+        cost = count_tokens(text, model) + (sep_tokens if kept else 0)
+        if used + cost <= budget:
+            kept.append({**doc, "text": text})
+            used += cost
+    if not kept:
+        first = next(((doc, text) for doc, text in zip(ranked, trimmed) if text), None)
+        cut = _truncate(first[1], budget, model) if first else ""
+        if cut:
+            kept.append({**first[0], "text": cut})
+    text = separator.join(d["text"] for d in kept)
+    return PackedContext(text, kept, count_tokens(text, model), tokens_in, len(docs) - len(kept))
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import List, Dict, Any, Optional, AsyncIterator
+import httpx
+import litellm
+from dotenv import load_dotenv
+from cache import ResponseCache, cache_key
+from singleflight import SingleFlight
+from resilience import Upstreams, CircuitOpenError, is_upstream_failure
+from router import Router
+from metrics import (current_endpoint, record_usage, LLM_REQUESTS, LLM_LATENCY, LLM_RETRIES, LLM_ERRORS,
+                     LLM_CACHE, LLM_TTFT, LLM_TOKENS, LLM_COALESCED)
+
+load_dotenv()
+
+logger = logging.getLogger("gateway")
+
+API_BASE = os.getenv("LITELLM_API_BASE", "http://localhost:4000")
+MAX_CONNECTIONS = int(os.getenv("GATEWAY_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("GATEWAY_MAX_KEEPALIVE", "20"))
+# Overall budget for one call_model invocation, retries and backoff included
+DEFAULT_DEADLINE_S = float(os.getenv("GATEWAY_DEADLINE_S", "90"))
+# Per-model budget when comparing models side by side
+COMPARE_DEADLINE_S = float(os.getenv("GATEWAY_COMPARE_DEADLINE_S", "45"))
+
+_client: Optional[httpx.AsyncClient] = None
+
+# Shared response cache; see cache.py for the RESPONSE_CACHE_* settings
+response_cache = ResponseCache.from_env()
+# Identical model calls in flight at the same time share one upstream request (SINGLEFLIGHT=off disables)
+inflight = SingleFlight.from_env()
+# Per-model circuit breaker and adaptive concurrency limit (UPSTREAM_GUARD=off disables)
+upstreams = Upstreams.from_env()
+# Picks the fastest healthy deployment of a model and hedges slow calls; see router.py for MODEL_DEPLOYMENTS
+router = Router.from_env(is_healthy=lambda deployment: upstreams.breaker(deployment).retry_after() == 0)
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Shared, pooled HTTP client. litellm picks it up through aclient_session,
+    so every request to the proxy reuses the same keep-alive connections.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS,
+                                max_keepalive_connections=MAX_KEEPALIVE),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        litellm.aclient_session = _client
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+async def call_model(model_name: str, messages: List[Dict[str, str]], timeout: int = 60,
+                     max_retries: int = 2, deadline: float = DEFAULT_DEADLINE_S,
+                     params: Dict[str, Any] = None, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Non-blocking model call with retries. `timeout` bounds each attempt and
+    `deadline` bounds the whole call, so a slow upstream cannot hold a
+    request longer than the caller allows. `params` are extra generation
+    params (temperature, max_tokens, ...) and are part of the cache key.
+    The result's "cache" field is "memory", "disk", "miss" or "bypass", or
+    "coalesced" when the answer came from an identical call already in
+    flight for another request; if that call failed (e.g. on its own,
+    shorter deadline) while this one still has budget, it is made again. Upstream calls go through the router, so
+    `model_name` may stand for several equivalent deployments; the result
+    then says which one answered ("deployment") and whether the call was
+    hedged.
+    """
+    params = params or {}
+    endpoint = current_endpoint.get()
+    key = cache_key(model_name, messages, params)
+    cache_status = "bypass"
+    if use_cache:
+        cached, cache_status = await response_cache.aget(key)
+        LLM_CACHE.inc(model=model_name, endpoint=endpoint, result=cache_status)
+        if cached is not None:
+            LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="cached")
+            return {"resp": cached, "latency_ms": 0, "error": None, "cache": cache_status}
+
+    start = time.time()
+    for joined_before in (False, True):
+        remaining = deadline - (time.time() - start) if joined_before else deadline
+        try:
+            result, shared = await inflight.do(
+                key, lambda: router.route(
+                    model_name, lambda deployment, budget: _call_upstream(
+                        deployment, messages, timeout, max_retries, budget, params, use_cache, key, cache_status),
+                    remaining),
+                timeout=remaining)
+        except asyncio.TimeoutError:
+            # only a coalesced waiter gets here; the caller that started the call returns its own deadline error
+            LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type="DeadlineExceeded")
+            LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="error")
+            return {"resp": None, "latency_ms": int((time.time() - start) * 1000),
+                    "error": f"deadline of {deadline}s exceeded", "cache": cache_status}
+        if not shared:
+            return result
+        # the call we joined may have failed on its starter's shorter deadline; with budget left, try again
+        # (callers retrying together coalesce again, so a failing upstream still sees one call per group)
+        if not result.get("error") or joined_before or deadline - (time.time() - start) <= 0:
+            break
+    LLM_COALESCED.inc(model=model_name, endpoint=endpoint)
+    LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="coalesced")
+    return {**result, "latency_ms": int((time.time() - start) * 1000), "cache": "coalesced"}
+
+
+async def _call_upstream(model_name: str, messages: List[Dict[str, str]], timeout: int, max_retries: int,
+                         deadline: float, params: Dict[str, Any], use_cache: bool, key: str,
+                         cache_status: str) -> Dict[str, Any]:
+    """The retrying upstream part of call_model, run once per group of coalesced callers."""
+    endpoint = current_endpoint.get()
+    get_client()
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        start = time.time()
+        try:
+            async with upstreams.guard(model_name, timeout=give_up_at - loop.time()):
+                start = time.time()
+                remaining = give_up_at - loop.time()
+                resp = await asyncio.wait_for(
+                    litellm.acompletion(model=model_name, messages=messages, timeout=min(timeout, remaining),
+                                        api_base=API_BASE, api_key=os.getenv("LITELLM_API_KEY"), **params),
+                    timeout=remaining)
+            latency_ms = int((time.time() - start) * 1000)
+            LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="ok")
+            LLM_LATENCY.observe(latency_ms / 1000, model=model_name, endpoint=endpoint)
+            record_usage(model_name, endpoint, resp)
+            if use_cache:
+                await response_cache.aset(key, resp.model_dump() if hasattr(resp, "model_dump") else resp)
+            return {"resp": resp, "latency_ms": latency_ms, "error": None, "cache": cache_status}
+        except asyncio.TimeoutError:
+            latency_ms = int((time.time() - start) * 1000)
+            logger.warning(f"Model call deadline exceeded (model={model_name}, deadline={deadline}s)")
+            LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type="DeadlineExceeded")
+            LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="error")
+            return {"resp": None, "latency_ms": latency_ms, "error": f"deadline of {deadline}s exceeded",
+                    "cache": cache_status}
+        except CircuitOpenError as e:
+            # fail fast: no upstream call and no retry while the circuit is open
+            LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type="CircuitOpen")
+            LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="error")
+            return {"resp": None, "latency_ms": 0, "error": str(e), "cache": cache_status}
+        except Exception as e:
+            latency_ms = int((time.time() - start) * 1000)
+            logger.exception(f"Model call error (model={model_name}): {e}")
+            LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type=type(e).__name__)
+            backoff = 0.5 * attempt
+            # a rejected request (4xx) or a local error fails the same way on every retry
+            if attempt > max_retries or give_up_at - loop.time() <= backoff or not is_upstream_failure(e):
+                LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="error")
+                return {"resp": None, "latency_ms": latency_ms, "error": str(e), "cache": cache_status}
+            LLM_RETRIES.inc(model=model_name, endpoint=endpoint)
+            await asyncio.sleep(backoff)
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_model(model_name: str, messages: List[Dict[str, str]], timeout: int = 60,
+                       max_retries: int = 2, deadline: float = DEFAULT_DEADLINE_S,
+                       params: Dict[str, Any] = None, use_cache: bool = True,
+                       stats: Dict[str, Any] = None) -> AsyncIterator[str]:
+    """
+    Streaming counterpart of call_model: yields text deltas as they arrive.
+    Retries only happen before the first token. When the stream ends,
+    `stats` holds latency_ms, ttft_ms, completion_tokens, tokens_per_s,
+    error and cache. A complete answer is stored in the response cache,
+    and a cache hit is replayed as one delta.
+    """
+    params = params or {}
+    stats = stats if stats is not None else {}
+    stats.update({"latency_ms": 0, "ttft_ms": None, "completion_tokens": 0, "tokens_per_s": None,
+                  "error": None, "cache": "bypass"})
+    endpoint = current_endpoint.get()
+    key = cache_key(model_name, messages, params)
+    if use_cache:
+        cached, stats["cache"] = await response_cache.aget(key)
+        LLM_CACHE.inc(model=model_name, endpoint=endpoint, result=stats["cache"])
+        if cached is not None:
+            LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="cached")
+            stats["ttft_ms"] = 0
+            yield cached["choices"][0]["message"]["content"] or ""
+            return
+
+    # streams go to the fastest healthy deployment; they are not hedged
+    deployment = router.candidates(model_name)[0]
+    get_client()
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+    start = time.time()
+    first_token_at = None
+    parts = []
+    usage_tokens = None
+    attempt = 0
+    try:
+        while True:
+            attempt += 1
+            try:
+                # the stream holds its concurrency slot until it ends; the limiter sees time to first token
+                async with upstreams.guard(deployment, timeout=give_up_at - loop.time()) as guard:
+                    attempt_start = time.time()
+                    stream = await asyncio.wait_for(
+                        litellm.acompletion(model=deployment, messages=messages, timeout=min(timeout, give_up_at - loop.time()),
+                                            api_base=API_BASE, api_key=os.getenv("LITELLM_API_KEY"), stream=True,
+                                            stream_options={"include_usage": True}, **params),
+                        timeout=give_up_at - loop.time())
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=give_up_at - loop.time())
+                        except StopAsyncIteration:
+                            break
+                        usage = getattr(chunk, "usage", None)
+                        if usage:
+                            usage_tokens = getattr(usage, "completion_tokens", None)
+                            record_usage(model_name, endpoint, chunk)
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            if first_token_at is None:
+                                first_token_at = time.time()
+                                guard.latency_s = first_token_at - attempt_start
+                                stats["ttft_ms"] = int((first_token_at - start) * 1000)
+                                LLM_TTFT.observe(first_token_at - start, model=model_name, endpoint=endpoint)
+                            parts.append(delta)
+                            yield delta
+                break
+            except (asyncio.TimeoutError, CircuitOpenError):
+                raise
+            except Exception as e:
+                logger.exception(f"Model stream error (model={model_name}): {e}")
+                LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type=type(e).__name__)
+                backoff = 0.5 * attempt
+                if (first_token_at is not None or attempt > max_retries or give_up_at - loop.time() <= backoff
+                        or not is_upstream_failure(e)):
+                    raise
+                LLM_RETRIES.inc(model=model_name, endpoint=endpoint)
+                await asyncio.sleep(backoff)
+    except asyncio.TimeoutError:
+        logger.warning(f"Model stream deadline exceeded (model={model_name}, deadline={deadline}s)")
+        LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type="DeadlineExceeded")
+        stats["error"] = f"deadline of {deadline}s exceeded"
+    except CircuitOpenError as e:
+        LLM_ERRORS.inc(model=model_name, endpoint=endpoint, error_type="CircuitOpen")
+        stats["error"] = str(e)
+    except Exception as e:
+        stats["error"] = str(e)
+
+    end = time.time()
+    stats["latency_ms"] = int((end - start) * 1000)
+    stats["completion_tokens"] = usage_tokens or len(parts)
+    if first_token_at is not None:
+        stats["tokens_per_s"] = round(stats["completion_tokens"] / max(end - first_token_at, 1e-3), 1)
+    if usage_tokens is None and parts:
+        LLM_TOKENS.inc(len(parts), model=model_name, endpoint=endpoint, kind="completion")
+    if stats["error"]:
+        LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="error")
+        return
+    LLM_REQUESTS.inc(model=model_name, endpoint=endpoint, status="ok")
+    LLM_LATENCY.observe(end - start, model=model_name, endpoint=endpoint)
+    if use_cache:
+        await response_cache.aset(key, {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]})
+
+
+async def compare_models(models: List[str], messages: List[Dict[str, str]],
+                         deadline: float = COMPARE_DEADLINE_S, use_cache: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Send the same messages to every model concurrently. Each model gets its
+    own deadline; a slow or failing provider comes back as an error entry
+    instead of holding up the others, so wall-clock time tracks the slowest
+    model that answers within its deadline.
+    """
+    unique = list(dict.fromkeys(models))
+    results = await asyncio.gather(*(call_model(m, messages, deadline=deadline, use_cache=use_cache) for m in unique),
+                                   return_exceptions=True)
+    out = {}
+    for m, r in zip(unique, results):
+        if isinstance(r, BaseException):
+            logger.error(f"Compare call failed (model={m}): {r}")
+            r = {"resp": None, "latency_ms": 0, "error": str(r), "cache": "bypass"}
+        out[m] = r
+    return out
@@ -0,0 +1,161 @@
+import os
+import csv
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime
+from typing import List, Any, Optional
+
+logger = logging.getLogger("log_writer")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # columnar output is optional
+    pa = pq = None
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Writes log rows from a background thread so request handlers only pay
+    for a queue put.
+
+    Rows are flushed in batches once `flush_rows` are waiting or
+    `flush_interval_s` has passed. The active CSV (`<dir>/<name>.csv`) is
+    rotated to `<name>-YYYYmmdd-HHMMSS.csv` when it grows past `max_bytes`,
+    when the day changes (rotate="daily"), or when its header no longer
+    matches `fields`. With `parquet=True` every batch is also written as a
+    Parquet part under `<dir>/parquet/date=YYYY-MM-DD/`.
+    """
+
+    def __init__(self, directory: str, name: str, fields: List[str], flush_rows: int = 200,
+                 flush_interval_s: float = 1.0, rotate: str = "size", max_bytes: int = 50 * 1024 * 1024,
+                 parquet: bool = False, queue_size: int = 100_000):
+        self.directory = directory
+        self.name = name
+        self.fields = list(fields)
+        self.path = os.path.join(directory, f"{name}.csv")
+        self.flush_rows = flush_rows
+        self.flush_interval_s = flush_interval_s
+        self.rotate = rotate
+        self.max_bytes = max_bytes
+        self.parquet = parquet and pa is not None
+        if parquet and pa is None:
+            logger.warning("LOG_PARQUET requested but pyarrow is not installed; writing CSV only")
+        self.dropped = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._part = 0
+        os.makedirs(directory, exist_ok=True)
+        self._prepare_file()
+
+    @classmethod
+    def from_env(cls, directory: str, name: str, fields: List[str]) -> "LogWriter":
+        return cls(directory, name, fields,
+                   flush_rows=int(os.getenv("LOG_FLUSH_ROWS", "200")),
+                   flush_interval_s=float(os.getenv("LOG_FLUSH_INTERVAL_S", "1.0")),
+                   rotate=os.getenv("LOG_ROTATE", "size"),
+                   max_bytes=int(float(os.getenv("LOG_MAX_MB", "50")) * 1024 * 1024),
+                   parquet=os.getenv("LOG_PARQUET", "").lower() in ("1", "true", "on"))
+
+    def start(self) -> "LogWriter":
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"log-writer-{self.name}", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return self
+
+    def write(self, row: List[Any]):
+        """Queue one row (in `fields` order). Never blocks; drops the row if the queue is full."""
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 10.0):
+        """Flush everything queued so far and stop the writer thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self._thread = None
+
+    # --- writer thread ---
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval_s
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.flush_rows or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval_s
+
+    def _flush(self, batch: List[List[Any]]):
+        if not batch:
+            return
+        try:
+            self._maybe_rotate()
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(batch)
+            if self.parquet:
+                self._write_parquet(batch)
+        except Exception:
+            logger.exception(f"Failed to flush {len(batch)} log rows")
+
+    def _prepare_file(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), None)
+            if header != self.fields:
+                # schema changed: keep the old file readable under its own header
+                self._rotate_file()
+        if not os.path.exists(self.path):
+            with open(self.path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(self.fields)
+
+    def _maybe_rotate(self):
+        if not os.path.exists(self.path):
+            return self._prepare_file()
+        st = os.stat(self.path)
+        too_big = st.st_size >= self.max_bytes
+        new_day = (self.rotate == "daily"
+                   and datetime.fromtimestamp(st.st_mtime).date() != datetime.now().date())
+        if too_big or new_day:
+            self._rotate_file()
+            self._prepare_file()
+
+    def _rotate_file(self):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        target = os.path.join(self.directory, f"{self.name}-{stamp}.csv")
+        n = 1
+        while os.path.exists(target):
+            target = os.path.join(self.directory, f"{self.name}-{stamp}-{n}.csv")
+            n += 1
+        os.replace(self.path, target)
+
+    def _write_parquet(self, batch: List[List[Any]]):
+        columns = {f: [r[i] if i < len(r) else None for r in batch] for i, f in enumerate(self.fields)}
+        try:
+            table = pa.table(columns)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # mixed types in a column: fall back to strings
+            table = pa.table({f: [None if v is None else str(v) for v in col] for f, col in columns.items()})
+        day = datetime.now().strftime("%Y-%m-%d")
+        out_dir = os.path.join(self.directory, "parquet", f"date={day}")
+        os.makedirs(out_dir, exist_ok=True)
+        self._part += 1
+        name = f"{self.name}-{int(time.time() * 1000)}-{os.getpid()}-{self._part}.parquet"
+        pq.write_table(table, os.path.join(out_dir, name))
@@ -1,11 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import logging
 import time
 
-from agents import planner_agent, retriever_agent, forecaster_agent, evaluator_agent
-from rag_utils import load_projects
-from utils import log_event
+from agents import (planner_agent, retriever_agent, forecaster_agent, evaluator_agent, forecaster_messages,
+                    evaluator_messages, score_responses)
+from rag_utils import load_projects, reload_projects, project_fingerprint
+from utils import log_event, log_writer
+from gateway import close_client, stream_model, sse_event, upstreams, router
+from semantic_cache import SemanticCache
+from pipeline import Pipeline, Stage
+from context_packer import pack_context, PackedContext
+from metrics import (current_endpoint, render as render_metrics, monitor_event_loop, HTTP_REQUESTS,
+                     HTTP_LATENCY, LLM_CACHE, CONTEXT_TOKENS)
 
 # FastAPI app
 app = FastAPI(title="Multi-Agent Risk Forecaster API")
@@ -13,52 +22,252 @@ app = FastAPI(title="Multi-Agent Risk Forecaster API")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("main")
 
-PROJECTS = load_projects("../data/projects.json")
+PROJECTS_PATH = "../data/projects.json"
+PROJECTS = load_projects(PROJECTS_PATH)
+
+# Answers near-duplicate /ask prompts without re-running the pipeline
+semantic_cache = SemanticCache.from_env()
+
+
+@app.on_event("startup")
+async def startup():
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.loop_monitor.cancel()
+    await close_client()
+    log_writer.close()
+
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    """Time every request and label model calls made while serving it with the endpoint."""
+    token = current_endpoint.set(request.url.path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        current_endpoint.reset(token)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text-format metrics."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/upstreams")
+async def get_upstreams():
+    """Circuit breaker state and adaptive concurrency limit per model."""
+    return upstreams.snapshot()
+
+
+@app.get("/router")
+async def get_router():
+    """Latency estimates per deployment and hedge/win rates per model."""
+    return router.snapshot()
+
+
+@app.post("/projects/reload")
+async def reload_project_data():
+    """Re-read projects.json, rebuild the retrieval indexes and drop cached answers of changed projects."""
+    changed = await asyncio.to_thread(reload_projects, PROJECTS, PROJECTS_PATH)
+    for pid in changed:
+        semantic_cache.invalidate_project(pid)
+    return {"projects": len(PROJECTS), "changed": changed}
+
 
 # Schemas
 class AskRequest(BaseModel):
     model_a: str
     model_b: str
+    models: list[str] = []  # extra models for the evaluator to compare
     prompt: str
     project_id: str | None = None
+    use_cache: bool = True  # set False to bypass the response cache
 
 
-@app.post("/ask")
-async def ask(req: AskRequest):
-    start = time.time()
+# --- /ask pipeline: each stage names the stages (or "req") whose results it needs ---
 
-    # Step 1: Planner decides route
+def plan_stage(req: AskRequest):
     plan = planner_agent(req.prompt)
-    log_event(endpoint="/ask", agent="planner", model=str(req.model_a)+","+str(req.model_b),prompt=req.prompt,response=str(plan),latency_ms=0)
+    log_event(endpoint="/ask", agent="planner", model=f"{req.model_a},{req.model_b}", prompt=req.prompt,
+              response=str(plan), latency_ms=0)
+    return plan
 
-    # Step 2: Retriever fetches docs if needed
-    docs = []
-    if plan["action"] in ["lookup", "risk_forecast"] and req.project_id:
-        docs = retriever_agent(PROJECTS, req.project_id, req.prompt)
-        log_event(endpoint="/ask", agent="retriever", model="",prompt=req.prompt, response=str(docs), latency_ms=0)
 
+def docs_stage(req: AskRequest, plan: dict):
+    docs = retriever_agent(PROJECTS, req.project_id, req.prompt)
+    log_event(endpoint="/ask", agent="retriever", model="", prompt=req.prompt, response=str(docs), latency_ms=0)
+    return docs
 
-    # Step 3: Forecaster if risk analysis
-    forecast = None
-    if plan["action"] == "risk_forecast":
-        forecast = forecaster_agent(docs, req.prompt, req.model_a)
 
-    # Step 4: Evaluator compares outputs
-    evaluation = evaluator_agent(req.prompt, docs, req.model_a, req.model_b)
-    latency = int((time.time() - start) * 1000)
+def packed_context(docs: list, model: str) -> PackedContext:
+    """Docs with repeated spans removed, packed into the context token budget for `model`."""
+    packed = pack_context(docs, model)
+    endpoint = current_endpoint.get()
+    CONTEXT_TOKENS.inc(packed.tokens, endpoint=endpoint, kind="sent")
+    CONTEXT_TOKENS.inc(packed.tokens_saved, endpoint=endpoint, kind="saved")
+    return packed
+
+
+def context_stage(req: AskRequest, docs: list) -> PackedContext:
+    # packed once for model_a and shared, so every evaluator model sees the same prompt
+    return packed_context(docs, req.model_a)
 
-    
-    result =  {
-        "plan": plan,
-        "docs": docs,
-        "forecast": forecast,
-        "evaluation": evaluation,
-        "latency_ms": latency,
-    }
+
+async def forecast_stage(req: AskRequest, plan: dict, context: PackedContext):
+    forecast = await forecaster_agent(context.docs, req.prompt, req.model_a, use_cache=req.use_cache)
+    log_event(endpoint="/ask", agent="forecaster", model=req.model_a, prompt=req.prompt,
+              response=forecast["forecast"], latency_ms=forecast["latency_ms"],
+              error=forecast["error"] or "", cache=forecast["cache"])
+    return forecast
+
+
+async def evaluation_stage(req: AskRequest, context: PackedContext):
+    evaluation = await evaluator_agent(req.prompt, context.docs, [req.model_a, req.model_b, *req.models],
+                                       use_cache=req.use_cache)
+    for m, r in evaluation["responses"].items():
+        log_event(endpoint="/ask", agent="evaluator", model=m, prompt=req.prompt, response=r["text"],
+                  latency_ms=r["latency_ms"], error=r["error"] or "", cache=r["cache"])
+    return evaluation
+
+
+# The forecaster and the evaluator only need the packed context, so they run concurrently
+ASK_PIPELINE = Pipeline([
+    Stage("plan", plan_stage, inputs=("req",)),
+    Stage("docs", docs_stage, inputs=("req", "plan"), default=[],
+          when=lambda req, plan: plan["action"] in ["lookup", "risk_forecast"] and bool(req.project_id)),
+    Stage("context", context_stage, inputs=("req", "docs")),
+    Stage("forecast", forecast_stage, inputs=("req", "plan", "context"),
+          when=lambda req, plan, context: plan["action"] == "risk_forecast"),
+    Stage("evaluation", evaluation_stage, inputs=("req", "context")),
+], params=("req",))
+
+
+@app.post("/ask")
+async def ask(req: AskRequest):
+    start = time.time()
+
+    # Step 0: Semantic cache for near-identical questions on the same project
+    scope = "|".join(["/ask", req.model_a, req.model_b, *req.models, req.project_id or ""])
+    fingerprint = project_fingerprint(PROJECTS, req.project_id)
+    vec = None
+    if req.use_cache and semantic_cache.enabled:
+        vec = await semantic_cache.embed(req.prompt)
+        if vec is not None:
+            hit, similarity = semantic_cache.lookup(scope, fingerprint, vec)
+            if hit:
+                LLM_CACHE.inc(model=f"{req.model_a},{req.model_b}", endpoint="/ask", result="semantic")
+                latency = int((time.time() - start) * 1000)
+                log_event(endpoint="/ask", agent="orchestrator", model=f"{req.model_a},{req.model_b}",
+                          prompt=req.prompt, response="completed", latency_ms=latency, cache="semantic")
+                return {**hit, "latency_ms": latency, "cache": "semantic", "similarity": round(similarity, 4)}
+
+    run = await ASK_PIPELINE.run(req=req)
+    latency = int((time.time() - start) * 1000)
+    result = {**run["results"], "context": run["results"]["context"].report(), "latency_ms": latency,
+              "timings": run["timings"]}
+    forecast, evaluation = result["forecast"], result["evaluation"]
 
     log_event(endpoint="/ask",agent="orchestrator", model=f"{req.model_a},{req.model_b}",prompt=req.prompt,response="completed",latency_ms=latency)
+
+    # only cache runs where every model answered
+    failed = (forecast and forecast["error"]) or any(r["error"] for r in evaluation["responses"].values())
+    if vec is not None and not failed:
+        semantic_cache.store(scope, fingerprint, vec,
+                             {k: v for k, v in result.items() if k not in ("latency_ms", "timings")})
     return result
 
+@app.post("/ask/stream")
+async def ask_stream(req: AskRequest):
+    """
+    Streaming /ask (server-sent events). "plan" and "docs" arrive first,
+    then the forecaster and every evaluator model stream concurrently as
+    "token" events tagged with stage and model ("stage_done" carries each
+    stream's latency, time to first token and tokens/sec), and "done"
+    carries the same result body as /ask.
+    """
+    async def events():
+        start = time.time()
+        plan = planner_agent(req.prompt)
+        log_event(endpoint="/ask/stream", agent="planner", model=f"{req.model_a},{req.model_b}", prompt=req.prompt,
+                  response=str(plan), latency_ms=0)
+        yield sse_event("plan", plan)
+
+        docs = []
+        if plan["action"] in ["lookup", "risk_forecast"] and req.project_id:
+            docs = retriever_agent(PROJECTS, req.project_id, req.prompt)
+            log_event(endpoint="/ask/stream", agent="retriever", model="", prompt=req.prompt, response=str(docs),
+                      latency_ms=0)
+        yield sse_event("docs", docs)
+        context = packed_context(docs, req.model_a)
+
+        # (stage, model) -> messages; every stream runs concurrently
+        streams = {}
+        if plan["action"] == "risk_forecast":
+            streams[("forecaster", req.model_a)] = forecaster_messages(context.docs, req.prompt)
+        for m in dict.fromkeys([req.model_a, req.model_b, *req.models]):
+            streams[("evaluator", m)] = evaluator_messages(context.docs, req.prompt)
+        texts = {k: [] for k in streams}
+        stats = {k: {} for k in streams}
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def pump(key, messages):
+            try:
+                async for delta in stream_model(key[1], messages, use_cache=req.use_cache, stats=stats[key]):
+                    queue.put_nowait((key, delta))
+            finally:
+                queue.put_nowait((key, None))
+
+        tasks = [asyncio.create_task(pump(k, msgs)) for k, msgs in streams.items()]
+        try:
+            pending = len(tasks)
+            while pending:
+                key, delta = await queue.get()
+                stage, model = key
+                if delta is None:
+                    pending -= 1
+                    run = stats[key]
+                    log_event(endpoint="/ask/stream", agent=stage, model=model, prompt=req.prompt,
+                              response="".join(texts[key]), latency_ms=run["latency_ms"], error=run["error"] or "",
+                              cache=run["cache"], ttft_ms=run["ttft_ms"], tokens_per_s=run["tokens_per_s"])
+                    yield sse_event("stage_done", {"stage": stage, "model": model, **run})
+                    continue
+                texts[key].append(delta)
+                yield sse_event("token", {"stage": stage, "model": model, "text": delta})
+        finally:
+            # client went away mid-stream: stop the upstream calls too
+            for t in tasks:
+                t.cancel()
+
+        forecast = None
+        if ("forecaster", req.model_a) in streams:
+            run = stats[("forecaster", req.model_a)]
+            forecast = {"model": req.model_a, "forecast": "".join(texts[("forecaster", req.model_a)]),
+                        "latency_ms": run["latency_ms"], "error": run["error"], "cache": run["cache"]}
+        evaluation = score_responses({
+            m: {"text": "".join(texts[(stage, m)]), "latency_ms": stats[(stage, m)]["latency_ms"],
+                "error": stats[(stage, m)]["error"], "cache": stats[(stage, m)]["cache"]}
+            for stage, m in streams if stage == "evaluator"})
+        latency = int((time.time() - start) * 1000)
+        log_event(endpoint="/ask/stream", agent="orchestrator", model=f"{req.model_a},{req.model_b}",
+                  prompt=req.prompt, response="completed", latency_ms=latency)
+        yield sse_event("done", {"plan": plan, "docs": docs, "context": context.report(), "forecast": forecast,
+                                 "evaluation": evaluation, "latency_ms": latency})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/health")
 async def health():
     return {"status":"ok"}
@@ -0,0 +1,122 @@
+import time
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from metrics import STAGE_LATENCY
+
+
+class Stage:
+    """
+    One step of a pipeline. `fn` is called with the results of `inputs`
+    as keyword arguments (a name is either another stage or a value passed
+    to Pipeline.run) and may be sync or async. If `when` is given and
+    returns False for those inputs, the stage is skipped and its result
+    is `default`.
+    """
+
+    def __init__(self, name: str, fn: Callable[..., Any], inputs: Iterable[str] = (),
+                 when: Optional[Callable[..., bool]] = None, default: Any = None):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.when = when
+        self.default = default
+
+
+class Pipeline:
+    """
+    Runs a DAG of stages: every stage starts as soon as all of its inputs
+    are done, so independent stages overlap. A stage that raises cancels
+    the rest and the exception propagates from run().
+    """
+
+    def __init__(self, stages: List[Stage], params: Iterable[str] = ()):
+        self.stages = {s.name: s for s in stages}
+        self.params = set(params)
+        if len(self.stages) != len(stages):
+            raise ValueError("duplicate stage names")
+        for s in stages:
+            unknown = [i for i in s.inputs if i not in self.stages and i not in self.params]
+            if unknown:
+                raise ValueError(f"stage {s.name!r} has unknown inputs {unknown}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"cycle through {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dep in self.stages[name].inputs:
+                if dep in self.stages:
+                    visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    async def run(self, **params) -> Dict[str, Any]:
+        """
+        Run every stage once. Returns {"results": {stage: result},
+        "timings": {"stages": {stage: {start_ms, end_ms, duration_ms,
+        status}}, "critical_path": [...], "total_ms": ...}}.
+        """
+        missing = self.params - params.keys()
+        if missing:
+            raise ValueError(f"missing pipeline params {sorted(missing)}")
+        t0 = time.perf_counter()
+        ms = lambda: round((time.perf_counter() - t0) * 1000, 1)
+        results: Dict[str, Any] = {}
+        timings: Dict[str, Dict[str, Any]] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_stage(stage: Stage):
+            deps = [tasks[d] for d in stage.inputs if d in tasks]
+            if deps:
+                await asyncio.gather(*deps)
+            kwargs = {i: results[i] if i in self.stages else params[i] for i in stage.inputs}
+            start = ms()
+            status = "ok"
+            if stage.when is not None and not stage.when(**kwargs):
+                result, status = stage.default, "skipped"
+            else:
+                result = stage.fn(**kwargs)
+                if inspect.isawaitable(result):
+                    result = await result
+            end = ms()
+            results[stage.name] = result
+            timings[stage.name] = {"start_ms": start, "end_ms": end, "duration_ms": round(end - start, 1),
+                                   "status": status}
+            if status == "ok":
+                STAGE_LATENCY.observe((end - start) / 1000, stage=stage.name)
+
+        # dependencies are created first, so every stage can await the tasks of its inputs
+        for name in self.order:
+            tasks[name] = asyncio.create_task(run_stage(self.stages[name]))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for t in tasks.values():
+                t.cancel()
+        return {"results": results,
+                "timings": {"stages": timings, "critical_path": self.critical_path(timings), "total_ms": ms()}}
+
+    def critical_path(self, timings: Dict[str, Dict[str, Any]]) -> List[str]:
+        """The chain of stages that determined the finish time: from the last stage to end, back through the input that finished last."""
+        if not timings:
+            return []
+        name = max(timings, key=lambda n: timings[n]["end_ms"])
+        path = [name]
+        while True:
+            deps = [d for d in self.stages[name].inputs if d in timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda n: timings[n]["end_ms"])
+            path.append(name)
+        return path[::-1]
@@ -1,11 +1,85 @@
-import json, os
+import json, os, math, re, hashlib
+from collections import Counter, defaultdict
 from typing import Dict, List
+import numpy as np
 
 PROMPT_TEMPLATES = {
     "system": "You are an expert construction project analyst. Answer clearly.",
     "forecaster": "You are a risk forecaster. Identify possible delays or risks in project milestones and estimate impacts."
 }
 
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """Per-project inverted index; postings hold precomputed BM25 weights."""
+
+    def __init__(self, texts: List[str], k1: float = 1.2, b: float = 0.75):
+        self.texts = texts
+        self.doc_len = []
+        raw = defaultdict(list)
+        for i, text in enumerate(texts):
+            tf = Counter(tokenize(text))
+            self.doc_len.append(sum(tf.values()))
+            for tok, count in tf.items():
+                raw[tok].append((i, count))
+        n = len(texts)
+        self.avgdl = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {}
+        self.postings = {}
+        for tok, plist in raw.items():
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            self.idf[tok] = idf
+            ids = np.array([i for i, _ in plist], dtype="int64")
+            tf = np.array([c for _, c in plist], dtype="float64")
+            dl = np.array([self.doc_len[i] for i in ids], dtype="float64")
+            self.postings[tok] = (ids, idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / self.avgdl)))
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict]:
+        scores = np.zeros(len(self.texts))
+        for tok in set(tokenize(query)):
+            posting = self.postings.get(tok)
+            if posting is not None:
+                ids, weights = posting
+                scores[ids] += weights  # ids are unique within one posting list
+        matched = np.flatnonzero(scores)  # ascending milestone order
+        k = min(top_k, len(matched))
+        top = matched[:0]
+        if k:
+            # top-k without a full sort; at the cut-off score, earlier milestones win ties
+            cutoff = scores[matched[np.argpartition(-scores[matched], k - 1)[k - 1]]]
+            above = matched[scores[matched] > cutoff]
+            top = np.concatenate([above, matched[scores[matched] == cutoff][:k - len(above)]])
+            top = top[np.lexsort((top, -scores[top]))]
+        hits = [{"text": self.texts[i], "score": round(float(scores[i]), 4)} for i in top]
+        # pad with unmatched milestones so callers still get top_k items
+        for i, text in enumerate(self.texts):
+            if len(hits) >= top_k:
+                break
+            if scores[i] == 0:
+                hits.append({"text": text, "score": 0.0})
+        return hits
+
+
+def build_project_index(proj: Dict) -> BM25Index:
+    proj["_index"] = BM25Index([f"{m['date']}: {m['title']} - {m['notes']}" for m in proj["milestones"]])
+    proj["_fingerprint"] = hashlib.sha256(json.dumps(proj["milestones"], sort_keys=True).encode("utf-8")).hexdigest()
+    return proj["_index"]
+
+
+def project_fingerprint(projects: Dict, pid: str) -> str:
+    proj = projects.get(pid) if pid else None
+    if not proj:
+        return ""
+    if "_fingerprint" not in proj:
+        build_project_index(proj)
+    return proj["_fingerprint"]
+
+
 def load_projects(path: str):
     if not os.path.exists(path):
         here = os.path.dirname(__file__)
@@ -14,16 +88,26 @@ def load_projects(path: str):
             path = alt
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
-    return {p["id"]: p for p in data.get("projects", [])}
+    projects = {p["id"]: p for p in data.get("projects", [])}
+    for p in projects.values():
+        build_project_index(p)
+    return projects
+
+
+def reload_projects(projects: Dict, path: str) -> List[str]:
+    """Re-read `path` into `projects` in place; returns ids whose milestones were added, removed or changed."""
+    fresh = load_projects(path)
+    changed = [pid for pid in set(projects) | set(fresh)
+               if project_fingerprint(projects, pid) != project_fingerprint(fresh, pid)]
+    # swap per key, never clear(): concurrent lookups see either the old or the new project
+    projects.update(fresh)
+    for pid in set(projects) - set(fresh):
+        projects.pop(pid, None)
+    return sorted(changed)
 
 def retrieve_relevant_docs(projects: Dict, pid: str, query: str, top_k: int = 3) -> List[Dict]:
     proj = projects.get(pid)
     if not proj:
         return []
-    q = set(query.lower().split())
-    scored = []
-    for m in proj["milestones"]:
-        text = f"{m['date']}: {m['title']} - {m['notes']}"
-        score = len(set(text.lower().split()) & q)
-        scored.append({"text": text, "score": score})
-    return sorted(scored, key=lambda x: -x["score"])[:top_k]
+    index = proj.get("_index") or build_project_index(proj)
+    return index.search(query, top_k=top_k)
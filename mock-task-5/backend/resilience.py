@@ -0,0 +1,279 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import httpx
+
+from metrics import CIRCUIT_STATE, CIRCUIT_REJECTED, CONCURRENCY_LIMIT, UPSTREAM_INFLIGHT
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    Whether an exception says the upstream is unhealthy: an upstream
+    timeout (408), 429, 5xx or a connection error. Other 4xx (bad request,
+    auth, context too long) are the caller's problem, and errors without an
+    HTTP status, including the caller's own deadline (asyncio.TimeoutError),
+    say nothing about the upstream; neither must trip the breaker.
+    """
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status in (408, 429) or status >= 500
+    return isinstance(exc, (ConnectionError, httpx.TransportError))
+
+
+class CircuitBreaker:
+    """
+    Closed: calls pass; `failure_threshold` consecutive upstream failures
+    open the circuit. Open: calls fail fast for `cooldown_s`. Half-open:
+    up to `half_open_max` probe calls pass; a success closes the circuit
+    and a failure opens it again for another cooldown.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown_s: float = 30.0, half_open_max: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.half_open_max = half_open_max
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_started = 0.0
+        self.rejected = 0
+        CIRCUIT_STATE.set(_STATE_VALUE[CLOSED], upstream=name)
+
+    def _set(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUE[state], upstream=self.name)
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now; counts the call as a probe when half-open."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown_s:
+                self.rejected += 1
+                CIRCUIT_REJECTED.inc(upstream=self.name)
+                return False
+            self._set(HALF_OPEN)
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            # a probe that never reported back (e.g. its caller was cancelled) frees its place after a cooldown
+            if self.probes >= self.half_open_max and time.monotonic() - self.probe_started < self.cooldown_s:
+                self.rejected += 1
+                CIRCUIT_REJECTED.inc(upstream=self.name)
+                return False
+            if self.probes >= self.half_open_max:
+                self.probes = 0
+            self.probes += 1
+            self.probe_started = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def record_abandoned(self):
+        """A call that ended without saying anything about the upstream gives back its probe place."""
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set(OPEN)
+
+    def retry_after(self) -> float:
+        """Seconds until an open circuit lets a probe through."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.cooldown_s - (time.monotonic() - self.opened_at))
+
+
+class AdaptiveLimiter:
+    """
+    AIMD cap on concurrent calls to one upstream. Every successful call
+    made while at least half the limit is in use raises the limit by
+    1/limit (about +1 per full window of calls); an upstream failure, or
+    a short-term latency average more than `latency_tolerance` times the
+    long-term one, multiplies it by `backoff` (at most once per
+    `decrease_interval_s`, so one burst of failures does not collapse it
+    to the minimum). Callers over the limit wait for a slot.
+    """
+
+    def __init__(self, name: str, initial: int = 16, min_limit: int = 1, max_limit: int = 256,
+                 backoff: float = 0.7, latency_tolerance: float = 2.0, decrease_interval_s: float = 1.0):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.decrease_interval_s = decrease_interval_s
+        self.inflight = 0
+        self.short_latency: Optional[float] = None
+        self.long_latency: Optional[float] = None
+        self.samples = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        CONCURRENCY_LIMIT.set(int(self.limit), upstream=name)
+
+    async def acquire(self):
+        """Wait for a slot (first come, first served); cancel the wait to give up."""
+        queued = bool(self._waiters)  # do not jump ahead of callers already waiting
+        while queued or self.inflight >= int(self.limit):
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                elif fut.done() and not fut.cancelled():
+                    self._wake()  # pass on the slot we were handed
+                raise
+            queued = False
+        self.inflight += 1
+        UPSTREAM_INFLIGHT.set(self.inflight, upstream=self.name)
+        self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.inflight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    def release(self, latency_s: Optional[float] = None, failed: bool = False):
+        """Return a slot and adjust the limit; `latency_s` is None when the call did not complete."""
+        self.inflight -= 1
+        UPSTREAM_INFLIGHT.set(self.inflight, upstream=self.name)
+        if failed or self._slow(latency_s):
+            now = time.monotonic()
+            if now - self._last_decrease >= self.decrease_interval_s:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif latency_s is not None and self.inflight + 1 >= self.limit / 2:
+            # only grow while the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        CONCURRENCY_LIMIT.set(int(self.limit), upstream=self.name)
+        self._wake()
+
+    def _slow(self, latency_s: Optional[float]) -> bool:
+        if latency_s is None:
+            return False
+        self.samples += 1
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency_s
+            return False
+        self.short_latency += 0.3 * (latency_s - self.short_latency)
+        self.long_latency += 0.02 * (latency_s - self.long_latency)
+        return self.samples >= 20 and self.short_latency > self.latency_tolerance * self.long_latency
+
+
+class Upstreams:
+    """One circuit breaker and one concurrency limiter per upstream (model name), created on first use."""
+
+    def __init__(self, enabled: bool = True, breaker_kwargs: Dict[str, Any] = None,
+                 limiter_kwargs: Dict[str, Any] = None):
+        self.enabled = enabled
+        self.breaker_kwargs = breaker_kwargs or {}
+        self.limiter_kwargs = limiter_kwargs or {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.limiters: Dict[str, AdaptiveLimiter] = {}
+
+    @classmethod
+    def from_env(cls) -> "Upstreams":
+        return cls(
+            enabled=os.getenv("UPSTREAM_GUARD", "on").lower() not in ("0", "off", "false"),
+            breaker_kwargs={"failure_threshold": int(os.getenv("BREAKER_FAILURES", "5")),
+                            "cooldown_s": float(os.getenv("BREAKER_COOLDOWN_S", "30"))},
+            limiter_kwargs={"initial": int(os.getenv("LIMITER_INITIAL", "16")),
+                            "min_limit": int(os.getenv("LIMITER_MIN", "1")),
+                            "max_limit": int(os.getenv("LIMITER_MAX", "256"))},
+        )
+
+    def breaker(self, upstream: str) -> CircuitBreaker:
+        if upstream not in self.breakers:
+            self.breakers[upstream] = CircuitBreaker(upstream, **self.breaker_kwargs)
+        return self.breakers[upstream]
+
+    def limiter(self, upstream: str) -> AdaptiveLimiter:
+        if upstream not in self.limiters:
+            self.limiters[upstream] = AdaptiveLimiter(upstream, **self.limiter_kwargs)
+        return self.limiters[upstream]
+
+    def guard(self, upstream: str, timeout: Optional[float] = None) -> "Guard":
+        return Guard(self, upstream, timeout)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Breaker state and concurrency limit per upstream, for monitoring."""
+        out = {}
+        for name, b in self.breakers.items():
+            out[name] = {"state": b.state, "consecutive_failures": b.failures, "rejected": b.rejected,
+                         "retry_after_s": round(b.retry_after(), 1)}
+        for name, lim in self.limiters.items():
+            out.setdefault(name, {}).update({
+                "limit": int(lim.limit), "inflight": lim.inflight,
+                "latency_short_ms": None if lim.short_latency is None else int(lim.short_latency * 1000),
+                "latency_long_ms": None if lim.long_latency is None else int(lim.long_latency * 1000)})
+        return out
+
+
+class Guard:
+    """
+    `async with upstreams.guard(model, timeout):` around one upstream
+    attempt. Entering raises CircuitOpenError if the circuit is open and
+    waits up to `timeout` for a concurrency slot (asyncio.TimeoutError);
+    leaving reports the outcome to the breaker and the limiter. Set
+    `latency_s` inside the block to report something other than the
+    block's duration (e.g. time to first token for a stream).
+    """
+
+    def __init__(self, upstreams: Upstreams, upstream: str, timeout: Optional[float]):
+        self.enabled = upstreams.enabled
+        self.upstream = upstream
+        self.timeout = timeout
+        self.latency_s: Optional[float] = None
+        if self.enabled:
+            self.breaker = upstreams.breaker(upstream)
+            self.limiter = upstreams.limiter(upstream)
+
+    async def __aenter__(self) -> "Guard":
+        if not self.enabled:
+            return self
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"circuit open for {self.upstream}; "
+                                   f"retry in {self.breaker.retry_after():.0f}s")
+        await asyncio.wait_for(self.limiter.acquire(), self.timeout)
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        if exc is None:
+            latency = self.latency_s if self.latency_s is not None else time.monotonic() - self._start
+            self.limiter.release(latency)
+            self.breaker.record_success()
+        elif is_upstream_failure(exc):
+            self.limiter.release(failed=True)
+            self.breaker.record_failure()
+        elif isinstance(getattr(exc, "status_code", None), int):
+            # the upstream answered, it just rejected this request
+            self.limiter.release()
+            self.breaker.record_success()
+        else:
+            # cancelled, out of the caller's deadline, or failed before reaching the upstream
+            self.limiter.release()
+            self.breaker.record_abandoned()
+        return False
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import LLM_ROUTED, LLM_HEDGED, LLM_HEDGE_WINS
+
+
+class LatencyStats:
+    """EWMA plus a window of recent samples (for percentiles) of one deployment's successful call latency."""
+
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        self.alpha = alpha
+        self.ewma: Optional[float] = None
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.errors = 0
+
+    def record(self, latency_s: float):
+        self.ewma = latency_s if self.ewma is None else self.ewma + self.alpha * (latency_s - self.ewma)
+        self.samples.append(latency_s)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Router:
+    """
+    Routes a logical model to one of its equivalent deployments (model
+    names the proxy serves the same model under). Each call goes to the
+    healthy deployment with the lowest latency EWMA; deployments without
+    samples yet go first so every one gets measured. If the call has not
+    finished after the primary's `hedge_quantile` latency (a fixed
+    `hedge_delay_s` until `min_samples` are in), a duplicate goes to the
+    next deployment and whichever answers first wins; the other is
+    cancelled. A model with a single deployment is never hedged.
+    """
+
+    def __init__(self, deployments: Dict[str, List[str]] = None, hedge_quantile: float = 0.9,
+                 hedge_delay_s: float = 3.0, min_hedge_delay_s: float = 0.2, min_samples: int = 20,
+                 hedging: bool = True, is_healthy: Callable[[str], bool] = None):
+        self.deployments = {m: list(dict.fromkeys(d)) for m, d in (deployments or {}).items()}
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay_s = hedge_delay_s
+        self.min_hedge_delay_s = min_hedge_delay_s
+        self.min_samples = min_samples
+        self.hedging = hedging
+        self.is_healthy = is_healthy or (lambda deployment: True)
+        self.stats: Dict[str, LatencyStats] = {}
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls, is_healthy: Callable[[str], bool] = None) -> "Router":
+        return cls(
+            deployments=json.loads(os.getenv("MODEL_DEPLOYMENTS", "") or "{}"),
+            hedge_quantile=float(os.getenv("HEDGE_QUANTILE", "0.9")),
+            hedge_delay_s=float(os.getenv("HEDGE_DELAY_S", "3")),
+            min_hedge_delay_s=float(os.getenv("HEDGE_MIN_DELAY_S", "0.2")),
+            hedging=os.getenv("HEDGING", "on").lower() not in ("0", "off", "false"),
+            is_healthy=is_healthy,
+        )
+
+    def _stats(self, deployment: str) -> LatencyStats:
+        if deployment not in self.stats:
+            self.stats[deployment] = LatencyStats()
+        return self.stats[deployment]
+
+    def _count(self, model: str, key: str):
+        counts = self.counts.setdefault(model, {"requests": 0, "hedged": 0, "hedge_wins": 0})
+        counts[key] += 1
+
+    def candidates(self, model: str) -> List[str]:
+        """Deployments for `model`, healthy ones first, each group fastest first."""
+        deployments = self.deployments.get(model) or [model]
+        ewma = lambda d: self._stats(d).ewma or 0.0
+        return sorted(deployments, key=lambda d: (not self.is_healthy(d), ewma(d)))
+
+    def hedge_delay(self, deployment: str) -> float:
+        stats = self._stats(deployment)
+        if len(stats.samples) < self.min_samples:
+            return self.hedge_delay_s
+        return max(self.min_hedge_delay_s, stats.percentile(self.hedge_quantile))
+
+    async def _timed(self, deployment: str, call: Callable[[str, float], Awaitable[Dict[str, Any]]],
+                     deadline: float) -> Dict[str, Any]:
+        start = time.monotonic()
+        try:
+            result = await call(deployment, deadline)
+        except asyncio.CancelledError:
+            # a cancelled call (usually a hedge loser) took at least this long; dropping it would hide the slow tail
+            self._stats(deployment).record(time.monotonic() - start)
+            raise
+        if result.get("error"):
+            self._stats(deployment).errors += 1
+        else:
+            self._stats(deployment).record(time.monotonic() - start)
+        return result
+
+    async def route(self, model: str, call: Callable[[str, float], Awaitable[Dict[str, Any]]],
+                    deadline: float) -> Dict[str, Any]:
+        """
+        Run `call(deployment, deadline)` (which returns a call_model style
+        result dict) on the best deployment, hedging as described above.
+        The result gains "deployment" and "hedged".
+        """
+        self._count(model, "requests")
+        ranked = self.candidates(model)
+        primary = ranked[0]
+        LLM_ROUTED.inc(model=model, deployment=primary)
+        if not self.hedging or len(ranked) < 2 or not self.is_healthy(ranked[1]):
+            return {**await self._timed(primary, call, deadline), "deployment": primary, "hedged": False}
+
+        started = time.monotonic()
+        first = asyncio.ensure_future(self._timed(primary, call, deadline))
+        delay = min(self.hedge_delay(primary), deadline)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(first), delay)
+            return {**result, "deployment": primary, "hedged": False}
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            first.cancel()
+            raise
+
+        backup = ranked[1]
+        self._count(model, "hedged")
+        LLM_HEDGED.inc(model=model)
+        LLM_ROUTED.inc(model=model, deployment=backup)
+        second = asyncio.ensure_future(self._timed(backup, call, max(0.0, deadline - (time.monotonic() - started))))
+        tasks = {first: primary, second: backup}
+        pending = set(tasks)
+        result = winner = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # prefer an answer over an error; take an error only when both failed
+                for task in sorted(done, key=lambda t: t is not first):
+                    if result is None or (result.get("error") and not task.result().get("error")):
+                        result, winner = task.result(), tasks[task]
+                if not result.get("error"):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        if winner == backup and not result.get("error"):
+            self._count(model, "hedge_wins")
+            LLM_HEDGE_WINS.inc(model=model, winner="hedge")
+        elif not result.get("error"):
+            LLM_HEDGE_WINS.inc(model=model, winner="primary")
+        return {**result, "deployment": winner, "hedged": True}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Latency estimates per deployment and hedge/win rates per model, for monitoring."""
+        deployments = {}
+        for name, s in self.stats.items():
+            p = lambda q: None if s.percentile(q) is None else int(s.percentile(q) * 1000)
+            deployments[name] = {"ewma_ms": None if s.ewma is None else int(s.ewma * 1000), "p50_ms": p(0.5),
+                                 "p90_ms": p(0.9), "samples": len(s.samples), "errors": s.errors,
+                                 "healthy": self.is_healthy(name)}
+        models = {}
+        for model, c in self.counts.items():
+            models[model] = {**c, "hedge_rate": round(c["hedged"] / c["requests"], 4) if c["requests"] else 0.0,
+                             "hedge_win_rate": round(c["hedge_wins"] / c["hedged"], 4) if c["hedged"] else None,
+                             "deployments": self.deployments.get(model) or [model]}
+        return {"models": models, "deployments": deployments}
@@ -0,0 +1,51 @@
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts
+    the work, later callers with the same key wait for that result instead
+    of repeating it. The key is forgotten as soon as the work finishes, so
+    this only merges calls that overlap in time (caching is separate).
+
+    The work runs as its own task and waiters are shielded from it: a
+    caller that is cancelled or gives up does not cancel the call the
+    others are waiting on.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def from_env(cls) -> "SingleFlight":
+        return cls(enabled=os.getenv("SINGLEFLIGHT", "on").lower() not in ("0", "off", "false"))
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Return (result, shared), where shared is True if another caller's
+        in-flight call produced the result. `timeout` bounds how long a
+        joining caller waits (asyncio.TimeoutError); the caller that starts
+        the call is expected to bound `fn` itself.
+        """
+        task = self._inflight.get(key) if self.enabled else None
+        if task is not None:
+            return await asyncio.wait_for(asyncio.shield(task), timeout), True
+        if not self.enabled:
+            return await fn(), False
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), False
+
+    def _forget(self, key: str, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every waiter has gone
@@ -1,29 +1,25 @@
 import time
-import csv
 import os
 import logging
 from typing import Dict, Any
+from log_writer import LogWriter
 
 
 LOG_DIR = "logs"
 LOG_FILE = os.path.join(LOG_DIR, "query_logs.csv")
-os.makedirs(LOG_DIR, exist_ok=True)
+LOG_FIELDS = ["ts", "endpoint", "agent", "model", "prompt", "response_len", "latency_ms", "error", "cache",
+              "ttft_ms", "tokens_per_s"]
 logger = logging.getLogger("backend_utils")
 logging.basicConfig(level=logging.INFO)
 
+# Rows are batched to disk by a background thread; call log_writer.close() on shutdown
+log_writer = LogWriter.from_env(LOG_DIR, "query_logs", LOG_FIELDS).start()
 
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["ts", "endpoint", "agent", "model",
-                        "prompt", "response_len", "error"])
 
-
-def log_event(endpoint: str, agent: str, model: str, prompt: str, response: str, latency_ms: int, error: str = ""):
+def log_event(endpoint: str, agent: str, model: str, prompt: str, response: str, latency_ms: int, error: str = "",
+              cache: str = "", ttft_ms: int = None, tokens_per_s: float = None):
     ts = int(time.time())
-    row = [ts, endpoint, agent, model, prompt.replace("\n", " "),len(response),latency_ms, error]
-    with open(LOG_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(row)
-    logger.info(f"LOG [{endpoint}] agent={agent} model={model} latency={latency_ms}ms error={error}")
-
+    row = [ts, endpoint, agent, model, prompt.replace("\n", " "),len(response),latency_ms, error, cache,
+           "" if ttft_ms is None else ttft_ms, "" if tokens_per_s is None else tokens_per_s]
+    log_writer.write(row)
+    logger.info(f"LOG [{endpoint}] agent={agent} model={model} latency={latency_ms}ms error={error} cache={cache}")
@@ -1,4 +1,5 @@
 # frontend/app.py
+import json
 import streamlit as st
 import requests
 from urllib.parse import urljoin
@@ -20,12 +21,62 @@ with st.sidebar:
     project_choice = st.selectbox(
         "Select project to ground on", list(projects.keys()))
 
+
+
+def iter_sse(resp):
+    """Yield (event, data) pairs from a server-sent-events response."""
+    event, data = None, []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and data:
+            yield event or "message", json.loads("\n".join(data))
+            event, data = None, []
+
+
 prompt = st.text_area(
     "Ask a question (e.g., 'What risks could delay Project A?')", height=140)
 
+stream_answers = st.checkbox("Stream answers", value=True)
+
 if st.button("Run multi-agent pipeline"):
     if not prompt.strip():
         st.warning("Please enter a prompt.")
+    elif stream_answers:
+        payload = {"model_a": model_a, "model_b": model_b,
+                   "prompt": prompt, "project_id": projects[project_choice]}
+        outputs = {}
+        with requests.post(urljoin(API_BASE, "/ask/stream"), json=payload, stream=True, timeout=120) as resp:
+            if resp.status_code != 200:
+                st.error(f"Backend error: {resp.text}")
+                st.stop()
+            for event, data in iter_sse(resp):
+                if event == "plan":
+                    st.subheader("🧭 Planner decision")
+                    st.json(data)
+                elif event == "docs":
+                    st.subheader("📂 Retrieved docs (RAG)")
+                    st.json(data)
+                elif event in ("token", "stage_done"):
+                    key = (data["stage"], data["model"])
+                    if key not in outputs:
+                        title = "📉 Forecaster" if data["stage"] == "forecaster" else "⚖️ Evaluator"
+                        st.subheader(f"{title} — {data['model']}")
+                        outputs[key] = {"text": "", "slot": st.empty()}
+                    if event == "token":
+                        outputs[key]["text"] += data["text"]
+                        outputs[key]["slot"].write(outputs[key]["text"])
+                    elif data.get("error"):
+                        st.error(data["error"])
+                    else:
+                        st.caption(f"{data['latency_ms']} ms · first token {data['ttft_ms']} ms · "
+                                   f"{data['tokens_per_s']} tokens/s")
+                elif event == "done":
+                    st.subheader("⚖️ Evaluation")
+                    st.json({"scores": data["evaluation"]["scores"], "winner": data["evaluation"]["winner"]})
+                    st.write(f"Pipeline latency: {data.get('latency_ms')} ms")
     else:
         payload = {"model_a": model_a, "model_b": model_b,
                    "prompt": prompt, "project_id": projects[project_choice]}
@@ -44,10 +95,16 @@ if st.button("Run multi-agent pipeline"):
             st.json(res["plan"])
             st.subheader("📂 Retrieved docs (RAG)")
             st.json(res["docs"])
+            if res.get("context"):
+                st.caption(f"Context: {res['context']['tokens']} tokens "
+                           f"({res['context']['tokens_saved']} saved by de-duplication and budgeting)")
             st.subheader("📉 Forecaster (primary model output)")
             st.json(res["forecast"])
             st.subheader("⚖️ Evaluator (compare models)")
             st.json(res["evaluation"])
             st.write(f"Pipeline latency: {res.get('latency_ms')} ms")
+            if res.get("timings"):
+                st.caption("Critical path: " + " → ".join(res["timings"]["critical_path"]))
+                st.json(res["timings"]["stages"])
             st.info(
                 "Logs are written to backend/logs/query_logs.csv — fetch and download from backend if needed.")
@@ -0,0 +1,144 @@
+import os
+import time
+import math
+import faiss
+import numpy as np
+
+INDEX_KINDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+COMPRESSIONS = ("none", "fp16", "int8", "pq")
+
+# PQ trains 256 centroids per sub-quantizer, so it needs at least this many vectors
+PQ_MIN_VECTORS = 256
+
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+
+def choose_index_kind(n: int) -> str:
+    """Exact search while it is cheap, HNSW for mid-size corpora, IVF-PQ once memory dominates."""
+    if n < 50_000:
+        return "flat"
+    if n < 1_000_000:
+        return "hnsw"
+    return "ivf_pq"
+
+
+def _nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but never more than the sample can train (39 points per centroid)
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _pq_m(dim: int, target: int = 64) -> int:
+    """Largest sub-quantizer count <= target that divides dim."""
+    return next(m for m in range(min(target, dim), 0, -1) if dim % m == 0)
+
+
+def resolve_index_type(n: int, kind: str = None, compression: str = None):
+    """
+    (kind, compression) after applying env defaults and "auto" selection
+    for `n` vectors. IVF-PQ on fewer than PQ_MIN_VECTORS vectors falls back
+    to an uncompressed index (flat, or IVF-flat if IVF was asked for).
+    """
+    kind = os.getenv("RAG_INDEX_KIND", "auto") if kind is None else kind
+    explicit_kind = kind == "ivf_pq"
+    compression = os.getenv("RAG_INDEX_COMPRESSION", "none") if compression is None else compression
+    if kind == "auto":
+        kind = "ivf_pq" if compression == "pq" else choose_index_kind(n)
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"unknown index kind {kind!r}; expected one of {INDEX_KINDS} or 'auto'")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"unknown compression {compression!r}; expected one of {COMPRESSIONS}")
+    if compression == "pq" and kind != "ivf_pq":
+        raise ValueError("pq compression is only available with kind='ivf_pq'")
+    if kind == "ivf_pq" and n < PQ_MIN_VECTORS:
+        # too few vectors to train the codebooks; a small corpus is cheap to search uncompressed
+        kind = "ivf_flat" if explicit_kind and _nlist(n) > 1 else "flat"
+        compression = "none"
+    return kind, compression
+
+
+def make_index(dim: int, n: int, kind: str = None, compression: str = None, n_train: int = None):
+    """
+    Create an (untrained) index for `n` vectors of size `dim`. `kind` is one
+    of INDEX_KINDS or "auto"; `compression` is fp16/int8 scalar
+    quantization or "pq" (which implies IVF-PQ). Both default to the
+    RAG_INDEX_KIND / RAG_INDEX_COMPRESSION env settings. `n_train` is
+    the training sample size that bounds the IVF list count (default n).
+    """
+    kind, compression = resolve_index_type(n, kind, compression)
+    sq = _SQ_TYPES.get(compression)
+
+    if kind == "flat":
+        return faiss.IndexScalarQuantizer(dim, sq) if sq is not None else faiss.IndexFlatL2(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWSQ(dim, sq, 32) if sq is not None else faiss.IndexHNSWFlat(dim, 32)
+        index.hnsw.efConstruction = 80
+        index.hnsw.efSearch = 64
+        return index
+    nlist = _nlist(min(n, n_train or n))
+    quantizer = faiss.IndexFlatL2(dim)
+    if kind == "ivf_pq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, _pq_m(dim), 8)
+    elif sq is not None:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq)
+    else:
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    index.nprobe = min(nlist, max(8, nlist // 16))
+    return index
+
+
+def build_ann_index(vectors, kind=None, compression=None, train_size=100_000, seed=0):
+    """Build and fill an index, training IVF/PQ/SQ codebooks on a random sample of at most `train_size` vectors."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+    index = make_index(dim, n, kind, compression, n_train=min(n, train_size))
+    if not index.is_trained:
+        if n > train_size:
+            sample = vectors[np.random.default_rng(seed).choice(n, train_size, replace=False)]
+        else:
+            sample = vectors
+        index.train(sample)
+    index.add(vectors)
+    return index
+
+
+def index_bytes(index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def recall_report(index, vectors, queries=None, k=10, n_queries=200, seed=0) -> dict:
+    """
+    Recall@k of `index` against exact search over the same `vectors`, plus
+    per-query latency and index size for both. Without `queries`, uses a
+    sample of the vectors with a little noise added (so a query is not
+    trivially its own nearest neighbour).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n = len(vectors)
+    if n == 0:
+        return {}
+    k = min(k, n)
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        queries = vectors[rng.choice(n, min(n_queries, n), replace=False)]
+        queries = queries + rng.normal(0, 0.1 * float(vectors.std()), queries.shape).astype("float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+
+    t0 = time.perf_counter()
+    _, truth = exact.search(queries, k)
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    t0 = time.perf_counter()
+    _, found = index.search(queries, k)
+    ann_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+    hits = sum(len(set(t) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return {
+        "index": type(index).__name__,
+        "k": k,
+        f"recall@{k}": round(hits / (k * len(queries)), 4),
+        "latency_ms": round(ann_ms, 4),
+        "exact_latency_ms": round(exact_ms, 4),
+        "bytes_per_vector": round(index_bytes(index) / n, 1),
+        "exact_bytes_per_vector": round(index_bytes(exact) / n, 1),
+    }
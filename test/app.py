@@ -1,26 +1,105 @@
 import streamlit as st
-from rag_agent import extract_pdf_text, chunk_text, build_index, retrieve, run_agent
+import os
+from rag_agent import run_agent
+from index_store import INDEX_DIR, file_hash, load_index, save_index
+from ingest import IngestPipeline
+from vector_store import get_store
 
 st.set_page_config(page_title="📄 RAG Agent", layout="wide")
 
 st.title("📄 RAG Agent with PDF Upload + Streaming")
 
+
+def add_to_store(key, name, project, chunks):
+    """Register a finished document in the shared store (a no-op if it is already there unchanged)."""
+    metas = [chunks.meta(i) for i in range(len(chunks))] if hasattr(chunks, "meta") else None
+    get_store().add_document(key, chunks, project=project or None, name=name, metas=metas)
+
+
+@st.cache_resource(show_spinner=False)
+def get_index(key: str, _data: bytes):
+    """
+    Ingest once per document (keyed on the file hash only, so editing the
+    project does not start a second ingest). A saved index is loaded from
+    disk; otherwise ingestion streams in the background and is saved when
+    it finishes. The upload is spooled to disk so extraction workers can
+    each open it.
+    """
+    loaded = load_index(key)
+    if loaded is not None:
+        return IngestPipeline.from_saved(*loaded)
+    upload_dir = os.path.join(os.path.dirname(INDEX_DIR), "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, f"{key}.pdf")
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(_data)
+
+    def on_complete(index, chunks):
+        save_index(key, index, chunks)
+
+    return IngestPipeline(path, workers=os.cpu_count() or 1, on_complete=on_complete).start()
+
+
+store = get_store()
+with st.sidebar:
+    project = st.text_input("Project", help="Documents uploaded now are filed under this project.").strip()
+    st.write("### Stored documents")
+    for doc in store.documents():
+        col_name, col_delete = st.columns([4, 1])
+        col_name.caption(f"{doc['name']} · {doc['project'] or 'no project'} · {doc['n_chunks']} chunks")
+        if col_delete.button("🗑", key=f"delete-{doc['doc_id']}"):
+            store.delete_document(doc["doc_id"])
+            st.rerun()
+
 uploaded_pdf = st.file_uploader("Upload a PDF", type=["pdf"])
 
 if uploaded_pdf:
-    with st.spinner("Extracting text..."):
-        text = extract_pdf_text(uploaded_pdf)
-        chunks = chunk_text(text)
-        index, chunks = build_index(chunks)
-    st.success("Index built!")
+    data = uploaded_pdf.getvalue()
+    key = file_hash(data)
+    pipeline = get_index(key, data)
+    progress = pipeline.progress()
+    if progress["error"]:
+        st.error(progress["error"])
+    elif progress["done"]:
+        # file finished documents in the shared store under the project currently entered
+        filed = st.session_state.setdefault("filed", set())
+        if (key, project) not in filed:
+            add_to_store(key, uploaded_pdf.name, project, pipeline.chunks)
+            filed.add((key, project))
+        st.success("Index ready!")
+        report = progress["index"] or {}
+        recall = next((v for k, v in report.items() if k.startswith("recall@")), None)
+        if recall is not None:
+            st.caption(f"{report['index']} ({report['compression']}): recall {recall:.1%} vs exact search, "
+                       f"{report['bytes_per_vector']:.0f} B/vector (exact {report['exact_bytes_per_vector']:.0f}), "
+                       f"{report['latency_ms']:.2f} ms/query (exact {report['exact_latency_ms']:.2f})")
+    else:
+        st.info(f"Still ingesting: {progress['chunks_indexed']} chunks from {progress['pages']} pages indexed "
+                "so far. You can ask now; answers use what is already indexed.")
 
     query = st.text_area("Ask a question about the PDF:")
     model = st.selectbox("Choose model", ["gpt-4.1-mini", "anthropic/claude-3-haiku"])
+    scope = st.radio("Search", ["This document", "This project", "All documents"], horizontal=True)
 
     if st.button("Ask"):
+        if scope == "This project" and not project:
+            st.warning("Enter a project name in the sidebar to search this project.")
+            st.stop()
         with st.spinner("Thinking..."):
-            context_chunks = retrieve(query, index, chunks)
-            response_stream = run_agent(query, context_chunks, model)
+            if scope == "This document":
+                hits = pipeline.retrieve(query, with_meta=True)
+                timings = pipeline.retriever.last_timings
+                st.caption("Retrieval: " + ", ".join(f"{k.removesuffix('_ms')} {v} ms"
+                                                     for k, v in timings.items() if k.endswith("_ms")))
+            else:
+                found = store.search(query, k=3, project=project if scope == "This project" else None)
+                hits = [(h["text"], h) for h in found]
+            context_chunks = [chunk for chunk, _ in hits]
+            context_stats = {}
+            response_stream = run_agent(query, context_chunks, model, stats=context_stats)
+            st.caption(f"Context: {context_stats['tokens']} tokens "
+                       f"({context_stats['tokens_saved']} saved by de-duplication and budgeting)")
 
             st.write("### Answer:")
             placeholder = st.empty()
@@ -31,3 +110,7 @@ if uploaded_pdf:
                     break
                 answer += delta
                 placeholder.write(answer)
+
+            pages = sorted({(m["page_start"], m["page_end"]) for _, m in hits if m["page_start"] is not None})
+            if pages:
+                st.caption("Sources: " + ", ".join(f"p. {s}" if s == e else f"pp. {s}-{e}" for s, e in pages))
@@ -0,0 +1,177 @@
+import re
+import bisect
+from typing import NamedTuple, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tokenizer is optional; fall back to an estimate
+    _ENCODING = None
+
+# a number at the start of a line ("1. Introduction", "2.3. Scope") is a heading or list label, not a sentence end
+_SENTENCE = re.compile(r"(?:^[ \t]*\d+(?:\.\d+)*\.(?=[ \t]))?(?:[^\n.!?]|[.!?](?=\S))*(?:[.!?]+|\n|$)", re.M)
+_HEADING = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?\s+[A-Z][^.!?]{0,80}|[A-Z][A-Z0-9 &/,()\-]{3,80})\s*$")
+
+
+def count_tokens(text: str) -> int:
+    """Token count with the cl100k tokenizer, or ~4 characters per token without tiktoken."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+
+class TextBuffer:
+    """
+    Append-only text that chunks point into by (start, end) character
+    offsets. Pages are kept as separate segments so appending stays cheap;
+    a slice only joins the few segments it touches.
+    """
+
+    def __init__(self):
+        self._segments = []
+        self._starts = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, text: str) -> int:
+        """Add text and return its start offset."""
+        start = self._size
+        self._segments.append(text)
+        self._starts.append(start)
+        self._size += len(text)
+        return start
+
+    def slice(self, start: int, end: int) -> str:
+        i = bisect.bisect_right(self._starts, start) - 1
+        parts = []
+        while i < len(self._segments) and self._starts[i] < end:
+            seg_start = self._starts[i]
+            parts.append(self._segments[i][max(0, start - seg_start):end - seg_start])
+            i += 1
+        return "".join(parts)
+
+    def text(self) -> str:
+        return "".join(self._segments)
+
+
+class Chunk(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    page_start: int
+    page_end: int
+    section: Optional[str]
+
+
+class SpanChunks:
+    """List-like view of chunk texts stored as spans over one TextBuffer."""
+
+    def __init__(self, buffer: TextBuffer):
+        self.buffer = buffer
+        self.spans = []
+
+    def append(self, chunk: Chunk):
+        self.spans.append(chunk)
+
+    def extend(self, chunks):
+        self.spans.extend(chunks)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, i):
+        span = self.spans[i]
+        return self.buffer.slice(span.start, span.end)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def meta(self, i) -> dict:
+        span = self.spans[i]
+        return {"page_start": span.page_start, "page_end": span.page_end,
+                "section": span.section, "tokens": span.tokens}
+
+
+class _Sentence(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    page: int
+    section: Optional[str]
+
+
+def _split_long(text: str, offset: int, max_tokens: int):
+    """Split a sentence over the budget at word boundaries into (start, end, tokens) pieces."""
+    words = list(re.finditer(r"\S+", text))
+    piece_start, piece_end, piece_tokens = None, None, 0
+    for w in words:
+        n = count_tokens(w.group())
+        if piece_start is not None and piece_tokens + n > max_tokens:
+            yield offset + piece_start, offset + piece_end, piece_tokens
+            piece_start, piece_tokens = None, 0
+        if piece_start is None:
+            piece_start = w.start()
+        piece_end = w.end()
+        piece_tokens += n
+    if piece_start is not None:
+        yield offset + piece_start, offset + piece_end, piece_tokens
+
+
+def iter_span_chunks(pages, buffer: TextBuffer, max_tokens=400, overlap_tokens=40):
+    """
+    Token-budgeted chunker over (page_number, text) pairs. Page text is
+    appended to `buffer` once and chunks are yielded as Chunk spans into it:
+    chunks end on sentence boundaries (a single over-long sentence is split
+    at words), stay within `max_tokens`, and repeat up to `overlap_tokens`
+    of trailing sentences from the previous chunk. A heading line starts a
+    new chunk once the current one is a quarter full and becomes the
+    `section` of the chunks that follow.
+    """
+    window, window_tokens = [], 0
+    section = None
+
+    def emit():
+        return Chunk(window[0].start, window[-1].end, sum(s.tokens for s in window),
+                     window[0].page, window[-1].page, window[0].section)
+
+    def carry_over():
+        kept, total = [], 0
+        for s in reversed(window[1:]):
+            if total + s.tokens > overlap_tokens:
+                break
+            kept.insert(0, s)
+            total += s.tokens
+        return kept, total
+
+    for page_no, text in pages:
+        offset = buffer.append(text + "\n")
+        for m in _SENTENCE.finditer(text):
+            raw = m.group()
+            stripped = raw.strip()
+            if not stripped:
+                continue
+            lead = len(raw) - len(raw.lstrip())
+            start = offset + m.start() + lead
+            heading = _HEADING.match(stripped) is not None
+            if heading and window and window_tokens >= max_tokens // 4:
+                yield emit()
+                window, window_tokens = [], 0
+            if heading:
+                section = stripped
+            tokens = count_tokens(stripped)
+            pieces = ([(start, start + len(stripped), tokens)] if tokens <= max_tokens
+                      else _split_long(stripped, start, max_tokens))
+            for p_start, p_end, p_tokens in pieces:
+                if window and window_tokens + p_tokens > max_tokens:
+                    yield emit()
+                    window, window_tokens = carry_over()
+                    # drop overlap that would not leave room for the new piece
+                    while window and window_tokens + p_tokens > max_tokens:
+                        window_tokens -= window.pop(0).tokens
+                window.append(_Sentence(p_start, p_end, p_tokens, page_no, section))
+                window_tokens += p_tokens
+    if window:
+        yield emit()
@@ -0,0 +1,132 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from litellm import embedding
+from dotenv import load_dotenv
+load_dotenv()
+
+CACHE_DIR = "cache"
+CACHE_PATH = os.path.join(CACHE_DIR, "embeddings.sqlite")
+
+
+def text_hash(text: str) -> str:
+    """Content address used as the cache key for a chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent (embed_model, chunk hash) -> vector store in SQLite."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vec BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))")
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes):
+        """Return {hash: vector} for the hashes already cached."""
+        found = {}
+        hashes = list(hashes)
+        # stay well under SQLite's bound-parameter limit
+        for i in range(0, len(hashes), 500):
+            part = hashes[i:i + 500]
+            marks = ",".join("?" * len(part))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [model, *part]).fetchall()
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype="float32")
+        return found
+
+    def put_many(self, model: str, items):
+        """Store (hash, vector) pairs."""
+        rows = [(model, h, np.asarray(v, dtype="float32").tobytes())
+                for h, v in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vec) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+
+class EmbeddingEngine:
+    """
+    Embeds texts in batches, keeps up to `max_concurrency` batches in flight,
+    and never re-embeds a chunk whose vector is already in the cache.
+    Engines are shared per embed model (get_engine), so per-call batch
+    settings are passed to embed() rather than set on the engine.
+    """
+
+    def __init__(self, embed_model="text-embedding-ada-002", batch_size=64, max_concurrency=4,
+                 cache: EmbeddingCache = None):
+        self.embed_model = embed_model
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.cache = cache or EmbeddingCache()
+        self.dim = None  # learned from the first vector seen
+        self.stats = {"hits": 0, "misses": 0, "batches": 0}
+
+    def _embed_batch(self, texts):
+        resp = embedding(model=self.embed_model, input=texts, api_base="http://localhost:4000",
+                         api_key=os.getenv("LITELLM_API_KEY"))
+        data = sorted(resp["data"], key=lambda d: d["index"])
+        return [d["embedding"] for d in data]
+
+    def embed(self, texts, batch_size: int = None, max_concurrency: int = None) -> np.ndarray:
+        """
+        Return a float32 (len(texts), dim) matrix, row-aligned with `texts`
+        (0 rows for no texts). `batch_size`/`max_concurrency` override the
+        engine defaults for this call only.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype="float32")
+        batch_size = batch_size or self.batch_size
+        max_concurrency = max_concurrency or self.max_concurrency
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.embed_model, set(hashes))
+        self.stats["hits"] += sum(1 for h in hashes if h in vectors)
+
+        # embed each unseen text once, even if it repeats in the input
+        pending = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectors and h not in pending:
+                pending[h] = t
+        self.stats["misses"] += len(pending)
+
+        if pending:
+            items = list(pending.items())
+            batches = [items[i:i + batch_size]
+                       for i in range(0, len(items), batch_size)]
+            with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+                results = pool.map(
+                    lambda b: self._embed_batch([t for _, t in b]), batches)
+                for batch, vecs in zip(batches, results):
+                    new = [(h, np.asarray(v, dtype="float32"))
+                           for (h, _), v in zip(batch, vecs)]
+                    self.cache.put_many(self.embed_model, new)
+                    vectors.update(new)
+                    self.stats["batches"] += 1
+
+        out = np.vstack([vectors[h] for h in hashes]).astype("float32")
+        self.dim = out.shape[1]
+        return out
+
+
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_engine(embed_model="text-embedding-ada-002", **kwargs) -> EmbeddingEngine:
+    """Shared engine per embed model, so indexing and querying use one cache."""
+    with _ENGINES_LOCK:
+        if embed_model not in _ENGINES:
+            _ENGINES[embed_model] = EmbeddingEngine(embed_model, **kwargs)
+        return _ENGINES[embed_model]
@@ -0,0 +1,170 @@
+import os
+import re
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Identifiers such as "A-1020", "MS_04" or "3.2.1" stay whole; their parts are indexed too.
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+
+def tokenize(text: str):
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        parts = re.split(r"[-_./]", tok)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class BM25Index:
+    """
+    Appendable BM25 index over chunk ids 0..n-1. Postings are kept as
+    (ids, tf) arrays per term and scored with NumPy at query time, so
+    chunks can be added while ingestion is still running.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}
+        self._arrays = {}
+        self._doc_len = []
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, texts):
+        with self._lock:
+            for text in texts:
+                doc = len(self._doc_len)
+                tf = Counter(tokenize(text))
+                length = sum(tf.values())
+                self._doc_len.append(length)
+                self._total_len += length
+                for tok, count in tf.items():
+                    self._postings.setdefault(tok, ([], []))
+                    self._postings[tok][0].append(doc)
+                    self._postings[tok][1].append(count)
+                    self._arrays.pop(tok, None)
+
+    def _term(self, tok):
+        arrays = self._arrays.get(tok)
+        if arrays is None:
+            ids, tfs = self._postings[tok]
+            arrays = self._arrays[tok] = (np.array(ids, dtype="int64"), np.array(tfs, dtype="float32"))
+        return arrays
+
+    def search(self, query: str, k: int = 10):
+        """Ids of the top-k chunks by BM25 score, best first (only chunks sharing a term)."""
+        with self._lock:
+            n = len(self._doc_len)
+            terms = [t for t in set(tokenize(query)) if t in self._postings]
+            if not n or not terms:
+                return np.empty(0, dtype="int64")
+            doc_len = np.asarray(self._doc_len, dtype="float32")
+            avgdl = self._total_len / n
+            scores = np.zeros(n, dtype="float32")
+            for tok in terms:
+                ids, tf = self._term(tok)
+                idf = np.log1p((n - len(ids) + 0.5) / (len(ids) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * doc_len[ids] / avgdl)
+                scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm)
+        matched = np.flatnonzero(scores)
+        k = min(k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+
+def rrf_fuse(rankings, k: int = 60, weights=None, top_k: int = None):
+    """
+    Reciprocal-rank fusion of several best-first id arrays:
+    score(id) = sum_r w_r / (k + rank_r(id)). Returns (ids, scores) best first.
+    """
+    rankings = [np.asarray(r, dtype="int64") for r in rankings]
+    weights = np.ones(len(rankings)) if weights is None else np.asarray(weights, dtype="float64")
+    if not any(len(r) for r in rankings):
+        return np.empty(0, dtype="int64"), np.empty(0)
+    ids = np.concatenate(rankings)
+    contrib = np.concatenate([w / (k + np.arange(1, len(r) + 1)) for r, w in zip(rankings, weights)])
+    unique, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=contrib)
+    order = np.argsort(-scores, kind="stable")
+    if top_k is not None:
+        order = order[:top_k]
+    return unique[order], scores[order]
+
+
+def litellm_reranker(model: str):
+    """Batched re-ranker: one litellm.rerank call scores every fused candidate for a query."""
+    from litellm import rerank
+
+    def score(query, texts):
+        resp = rerank(model=model, query=query, documents=list(texts), top_n=len(texts),
+                      api_base="http://localhost:4000", api_key=os.getenv("LITELLM_API_KEY"))
+        results = resp["results"] if isinstance(resp, dict) else resp.results
+        scores = np.zeros(len(texts), dtype="float32")
+        for r in results:
+            scores[r["index"]] = r["relevance_score"]
+        return scores
+
+    return score
+
+
+class HybridRetriever:
+    """
+    Runs a dense search and a BM25 search concurrently, fuses them with
+    RRF and, if a `reranker(query, texts) -> scores` is set, re-scores the
+    fused candidates in one batch. `dense_search(query, n)` returns chunk
+    ids best first; `texts[i]` is chunk i. Every call records per-stage
+    milliseconds in `last_timings`.
+    """
+
+    def __init__(self, dense_search, lexical: BM25Index, texts, reranker=None,
+                 candidates: int = 20, rrf_k: int = 60, weights=(1.0, 1.0)):
+        self.dense_search = dense_search
+        self.lexical = lexical
+        self.texts = texts
+        self.reranker = reranker
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.weights = weights
+        self.last_timings = {}
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid")
+
+    @staticmethod
+    def _timed(timings, name, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = round((time.perf_counter() - t0) * 1000, 2)
+
+    def search(self, query: str, k: int = 3):
+        """Top-k chunk ids, best first."""
+        timings = {}
+        t0 = time.perf_counter()
+        n = max(self.candidates, k)
+        dense = self._pool.submit(self._timed, timings, "dense_ms", self.dense_search, query, n)
+        lexical = self._pool.submit(self._timed, timings, "lexical_ms", self.lexical.search, query, n)
+        dense_ids, lexical_ids = dense.result(), lexical.result()
+
+        t1 = time.perf_counter()
+        fused, _ = rrf_fuse([dense_ids, lexical_ids], self.rrf_k, self.weights,
+                            top_k=n if self.reranker else k)
+        timings["fusion_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+
+        if self.reranker is not None and len(fused):
+            t1 = time.perf_counter()
+            scores = np.asarray(self.reranker(query, [self.texts[int(i)] for i in fused]))
+            fused = fused[np.argsort(-scores, kind="stable")]
+            timings["rerank_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+        timings["total_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        timings["candidates"] = {"dense": len(dense_ids), "lexical": len(lexical_ids)}
+        self.last_timings = timings
+        return [int(i) for i in fused[:k]]
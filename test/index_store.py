@@ -0,0 +1,156 @@
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import tempfile
+import faiss
+import numpy as np
+from chunking import SpanChunks
+
+INDEX_DIR = os.path.join("cache", "indexes")
+
+
+def file_hash(data: bytes) -> str:
+    """Key an index by the content of the uploaded document."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkStore:
+    """
+    Read-only list of chunks backed by a memory-mapped text file and an
+    (n, 2) array of byte spans into it, so opening a large store does not
+    load every chunk. Span-chunked documents store their text once and
+    overlapping chunks share it. `pages` is an (n, 2) array of each
+    chunk's first/last page and `meta(i)` adds the section, both None for
+    stores written without that metadata. Stores saved in the older
+    offsets.npy layout still load.
+    """
+
+    def __init__(self, path: str):
+        spans_path = os.path.join(path, "spans.npy")
+        if os.path.exists(spans_path):
+            self._spans = np.load(spans_path, mmap_mode="r")
+        else:
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+            self._spans = np.stack([offsets[:-1], offsets[1:]], axis=1)
+        pages_path = os.path.join(path, "pages.npy")
+        self.pages = np.load(pages_path, mmap_mode="r") if os.path.exists(pages_path) else None
+        sections_path = os.path.join(path, "sections.json")
+        if os.path.exists(sections_path):
+            with open(sections_path, encoding="utf-8") as f:
+                self._section_names = json.load(f)
+            self._section_ids = np.load(os.path.join(path, "section_ids.npy"), mmap_mode="r")
+        else:
+            self._section_names, self._section_ids = [], None
+        self._file = open(os.path.join(path, "chunks.txt"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        start, end = int(self._spans[i][0]), int(self._spans[i][1])
+        return self._buf[start:end].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def meta(self, i) -> dict:
+        pages = self.pages[i] if self.pages is not None else (None, None)
+        section = None
+        if self._section_ids is not None and self._section_ids[i] >= 0:
+            section = self._section_names[int(self._section_ids[i])]
+        return {"page_start": None if pages[0] is None else int(pages[0]),
+                "page_end": None if pages[1] is None else int(pages[1]), "section": section}
+
+    @staticmethod
+    def write(path: str, chunks, chunk_pages=None):
+        """Write plain chunk strings back to back, or a SpanChunks buffer once plus its spans."""
+        if isinstance(chunks, SpanChunks):
+            return ChunkStore._write_spans(path, chunks)
+        offsets = [0]
+        with open(os.path.join(path, "chunks.txt"), "wb") as f:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(os.path.join(path, "offsets.npy"), np.array(offsets, dtype="int64"))
+        if chunk_pages:
+            np.save(os.path.join(path, "pages.npy"), np.array(chunk_pages, dtype="int32").reshape(-1, 2))
+
+    @staticmethod
+    def _write_spans(path: str, chunks: "SpanChunks"):
+        buffer = chunks.buffer
+        # spans are character offsets in memory but byte offsets on disk
+        points = sorted({p for c in chunks.spans for p in (c.start, c.end)})
+        byte_at, pos, nbytes = {}, 0, 0
+        with open(os.path.join(path, "chunks.txt"), "wb") as f:
+            for p in points:
+                data = buffer.slice(pos, p).encode("utf-8")
+                f.write(data)
+                nbytes += len(data)
+                byte_at[p], pos = nbytes, p
+            f.write(buffer.slice(pos, len(buffer)).encode("utf-8"))
+        spans = [(byte_at[c.start], byte_at[c.end]) for c in chunks.spans]
+        np.save(os.path.join(path, "spans.npy"), np.array(spans, dtype="int64").reshape(-1, 2))
+        pages = [(c.page_start, c.page_end) for c in chunks.spans]
+        np.save(os.path.join(path, "pages.npy"), np.array(pages, dtype="int32").reshape(-1, 2))
+        names = {}
+        ids = [-1 if c.section is None else names.setdefault(c.section, len(names)) for c in chunks.spans]
+        np.save(os.path.join(path, "section_ids.npy"), np.array(ids, dtype="int32"))
+        with open(os.path.join(path, "sections.json"), "w", encoding="utf-8") as f:
+            json.dump(list(names), f)
+
+
+def _read_index_mmap(path: str):
+    # Flat indexes can only be mapped on newer faiss builds; fall back to a
+    # regular read rather than failing.
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def load_index(key: str, root: str = INDEX_DIR):
+    """Return (index, chunks) for a saved document, or None if not on disk."""
+    path = os.path.join(root, key)
+    if not os.path.exists(os.path.join(path, "index.faiss")):
+        return None
+    return _read_index_mmap(os.path.join(path, "index.faiss")), ChunkStore(path)
+
+
+def save_index(key: str, index, chunks, chunk_pages=None, root: str = INDEX_DIR):
+    """Persist index + chunks atomically so concurrent sessions never see a half-written store."""
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=root, prefix=f".{key}-")
+    try:
+        faiss.write_index(index, os.path.join(tmp, "index.faiss"))
+        ChunkStore.write(tmp, chunks, chunk_pages)
+        os.replace(tmp, os.path.join(root, key))
+    except OSError:
+        # another session saved the same document first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(root, key, "index.faiss")):
+            raise
+
+
+def load_or_build(data: bytes, build):
+    """
+    Load the saved index for `data` or call `build()` -> (index, chunks)
+    and save it. Returns (index, chunks, was_cached).
+    """
+    key = file_hash(data)
+    loaded = load_index(key)
+    if loaded is not None:
+        return loaded[0], loaded[1], True
+    index, chunks = build()
+    save_index(key, index, chunks)
+    return *load_index(key), False
@@ -0,0 +1,225 @@
+import os
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from embeddings import get_engine
+from pdf_extract import iter_pages, iter_pages_parallel
+from ann_index import resolve_index_type, build_ann_index, recall_report
+from chunking import TextBuffer, SpanChunks, iter_span_chunks
+from hybrid import BM25Index, HybridRetriever, litellm_reranker
+
+logger = logging.getLogger("ingest")
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """
+    Streams a PDF through extract -> chunk -> embed -> index.
+
+    A producer thread extracts pages and chunks them into a bounded queue;
+    the embedder takes batches off that queue, keeps up to
+    `max_concurrency` batches in flight and adds vectors to the FAISS index
+    in document order as they complete. Bounded queues give backpressure
+    in both directions, and the partial index can be searched while
+    ingestion is still running.
+
+    With `workers` > 1 and `pdf_file` given as a path, page extraction is
+    spread over a process pool (pages still arrive in order). Chunks are
+    sentence-aligned spans of at most `max_tokens` over one shared text
+    buffer (see chunking.iter_span_chunks) and carry page/section metadata.
+
+    Vectors go into an exact flat index while streaming. Once everything
+    is embedded, the index is rebuilt as `index_kind`/`compression` (see
+    ann_index; defaults come from the env and corpus size) if that differs,
+    and `index_report` records its recall against the exact index.
+
+    Chunks are also added to a BM25 index, and retrieve() fuses dense and
+    lexical results (see hybrid.HybridRetriever), re-ranking them when
+    RAG_RERANK_MODEL is set.
+    """
+
+    def __init__(self, pdf_file=None, embed_model="text-embedding-ada-002", max_tokens=400, overlap_tokens=40,
+                 batch_size=64, min_batch=8, max_concurrency=4, queue_batches=4, workers=1,
+                 index_kind=None, compression=None, on_complete=None):
+        self.pdf_file = pdf_file
+        self.workers = workers
+        self.embed_model = embed_model
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = batch_size
+        self.min_batch = min_batch
+        self.max_concurrency = max_concurrency
+        self.index_kind = index_kind
+        self.compression = compression
+        self.on_complete = on_complete
+        self.index = None
+        self.index_report = None
+        self.buffer = TextBuffer()
+        self.chunks = SpanChunks(self.buffer)
+        self.lexical = BM25Index()
+        self.pages = 0
+        self.error = None
+        self._retriever = None
+        self._chunk_queue = queue.Queue(maxsize=batch_size * queue_batches)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._drained = False
+        self._threads = []
+
+    @classmethod
+    def from_saved(cls, index, chunks):
+        """Wrap an already built index so callers can treat saved and live documents alike."""
+        pipeline = cls()
+        pipeline.index, pipeline.chunks = index, chunks
+        pipeline.lexical.add(chunks)
+        pipeline._done.set()
+        return pipeline
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def progress(self):
+        with self._lock:
+            indexed = self.index.ntotal if self.index is not None else 0
+        return {"pages": self.pages, "chunks_indexed": indexed, "done": self.done, "error": self.error,
+                "index": self.index_report}
+
+    def start(self):
+        for target in (self._produce, self._consume):
+            t = threading.Thread(target=target, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self
+
+    def _pages(self):
+        if self.workers > 1 and isinstance(self.pdf_file, (str, os.PathLike)):
+            pages = iter_pages_parallel(self.pdf_file, self.workers)
+        else:
+            pages = iter_pages(self.pdf_file)
+        for page in pages:
+            self.pages += 1
+            yield page
+
+    def _produce(self):
+        try:
+            for chunk in iter_span_chunks(self._pages(), self.buffer, self.max_tokens, self.overlap_tokens):
+                self._chunk_queue.put(chunk)
+        except Exception as e:
+            self.error = f"extraction failed: {e}"
+        finally:
+            self._chunk_queue.put(_DONE)
+
+    def _batches(self):
+        batch = []
+        while True:
+            item = self._chunk_queue.get()
+            if item is _DONE:
+                self._drained = True
+                break
+            batch.append(item)
+            # send a full batch, or at least min_batch chunks rather than idling the embedder
+            if len(batch) >= self.batch_size or (self._chunk_queue.empty() and len(batch) >= self.min_batch):
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _add(self, batch, vectors):
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexFlatL2(vectors.shape[1])
+            self.index.add(vectors)
+            self.chunks.extend(batch)
+            self.lexical.add(self.buffer.slice(c.start, c.end) for c in batch)
+
+    def _finalize_index(self):
+        """
+        Swap the streaming flat index for the configured ANN index and
+        record its recall. If that fails the flat index stays: it already
+        answers every query exactly, so the ingest is not failed for it.
+        """
+        n = self.index.ntotal
+        try:
+            kind, compression = resolve_index_type(n, self.index_kind, self.compression)
+            if kind == "flat" and compression == "none":
+                self.index_report = {"index": type(self.index).__name__, "kind": kind, "compression": compression}
+                return
+            vectors = self.index.reconstruct_n(0, n)
+            index = build_ann_index(vectors, kind, compression)
+            report = recall_report(index, vectors)
+        except Exception as e:
+            logger.exception(f"ANN index build failed; keeping the flat index ({n} vectors): {e}")
+            self.index_report = {"index": type(self.index).__name__, "kind": "flat", "compression": "none",
+                                 "error": str(e)}
+            return
+        with self._lock:
+            self.index = index
+        self.index_report = {**report, "kind": kind, "compression": compression}
+
+    def _consume(self):
+        engine = get_engine(self.embed_model)
+        in_flight = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                for batch in self._batches():
+                    in_flight.append((batch, pool.submit(engine.embed, [self.buffer.slice(c.start, c.end) for c in batch])))
+                    # keep at most max_concurrency batches outstanding
+                    while len(in_flight) >= self.max_concurrency:
+                        batch, fut = in_flight.popleft()
+                        self._add(batch, fut.result())
+                while in_flight:
+                    batch, fut = in_flight.popleft()
+                    self._add(batch, fut.result())
+            if self.error is None and self.index is not None:
+                self._finalize_index()
+                if self.on_complete:
+                    self.on_complete(self.index, self.chunks)
+        except Exception as e:
+            self.error = f"embedding failed: {e}"
+            # unblock the producer so its thread can finish
+            while not self._drained and self._chunk_queue.get() is not _DONE:
+                pass
+        finally:
+            self._done.set()
+
+    def _dense_ids(self, query, k):
+        q_vec = get_engine(self.embed_model).embed([query])
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return np.empty(0, dtype="int64")
+            D, I = self.index.search(np.asarray(q_vec, dtype="float32"), k)
+        return I[0][I[0] != -1]
+
+    @property
+    def retriever(self) -> HybridRetriever:
+        if self._retriever is None:
+            model = os.getenv("RAG_RERANK_MODEL")
+            self._retriever = HybridRetriever(self._dense_ids, self.lexical, self.chunks,
+                                              reranker=litellm_reranker(model) if model else None)
+        return self._retriever
+
+    def retrieve(self, query, k=3, with_meta=False, mode="hybrid"):
+        """
+        Top-k chunks for `query` from whatever has been indexed so far.
+        `mode` is "hybrid" (dense + BM25 fused, per-stage timings in
+        `retriever.last_timings`) or "dense". With `with_meta`, returns
+        (chunk, meta) pairs where meta holds page_start, page_end and
+        section (None for stores saved without them).
+        """
+        if mode == "dense":
+            ids = [int(i) for i in self._dense_ids(query, k)]
+        else:
+            ids = self.retriever.search(query, k)
+        if not with_meta:
+            return [self.chunks[i] for i in ids]
+        return [(self.chunks[i], self.chunks.meta(i)) for i in ids]
@@ -0,0 +1,47 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+
+# Kept free of heavy imports (faiss, litellm): spawned workers import this module.
+
+
+def iter_pages(pdf_file):
+    """Yield (page_number, text) for each page, 1-based, in the current process."""
+    reader = PdfReader(pdf_file)
+    for i, page in enumerate(reader.pages):
+        yield i + 1, page.extract_text() or ""
+
+
+def extract_page_range(path: str, start: int, end: int):
+    """Worker: open the PDF independently and extract pages [start, end)."""
+    reader = PdfReader(path)
+    return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def iter_pages_parallel(path: str, workers: int = None, pages_per_task: int = 16):
+    """
+    Yield (page_number, text) in page order, with page ranges extracted
+    by a process pool. Each worker opens the file itself, so nothing large
+    is pickled; at most 2 tasks per worker are outstanding so a slow
+    consumer does not pile up extracted text.
+    """
+    workers = workers or os.cpu_count() or 1
+    n = len(PdfReader(path).pages)
+    if workers <= 1 or n <= pages_per_task:
+        yield from iter_pages(path)
+        return
+    ranges = iter([(s, min(s + pages_per_task, n)) for s in range(0, n, pages_per_task)])
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(extract_page_range, path, start, end))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            yield from pending.popleft().result()
+            nxt = next(ranges, None)
+            if nxt is not None:
+                pending.append(pool.submit(extract_page_range, path, *nxt))
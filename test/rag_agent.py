@@ -1,61 +1,93 @@
 import os
-import faiss
-import numpy as np
-from litellm import completion, embedding
-from pypdf import PdfReader
+from litellm import completion
 from dotenv import load_dotenv
+from embeddings import get_engine
+from ann_index import build_ann_index
+from pdf_extract import iter_pages
+from context_packer import pack_context
 load_dotenv()
 
 
+def iter_pdf_pages(pdf_file):
+    """Yield the text of each PDF page as it is extracted."""
+    for _, text in iter_pages(pdf_file):
+        yield text
+
+
 def extract_pdf_text(pdf_file) -> str:
     """Extract raw text from PDF file."""
-    reader = PdfReader(pdf_file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    return text
+    return "".join(page + "\n" for page in iter_pdf_pages(pdf_file))
+
+
+def iter_page_chunks(pages, chunk_size=500, overlap=50):
+    """
+    Streaming chunker over (page_number, text) pairs in page order. Yields
+    (chunk, page_start, page_end) with the same overlapping word chunks
+    chunk_text would, holding at most one chunk of words in memory.
+    """
+    step = chunk_size - overlap
+    words, word_pages = [], []
+    for page_no, text in pages:
+        page_words = text.split()
+        words.extend(page_words)
+        word_pages.extend([page_no] * len(page_words))
+        while len(words) >= chunk_size:
+            yield " ".join(words[:chunk_size]), word_pages[0], word_pages[chunk_size - 1]
+            del words[:step], word_pages[:step]
+    while words:
+        n = min(chunk_size, len(words))
+        yield " ".join(words[:n]), word_pages[0], word_pages[n - 1]
+        del words[:step], word_pages[:step]
+
+
+def iter_chunks(texts, chunk_size=500, overlap=50):
+    """Streaming chunker over plain texts (e.g. pages), without page metadata."""
+    for chunk, _, _ in iter_page_chunks(enumerate(texts, 1), chunk_size, overlap):
+        yield chunk
 
 
 def chunk_text(text: str, chunk_size=500, overlap=50):
     """Split text into overlapping chunks."""
-    words = text.split()
-    chunks = []
-
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-
-    return chunks
-
+    return list(iter_chunks([text], chunk_size, overlap))
 
-def build_index(chunks, embed_model="text-embedding-ada-002"):
-    """Embed chunks and store in FAISS index."""
-    vectors = []
-    for chunk in chunks:
-        vec = embedding(model=embed_model, input=chunk, api_base="http://localhost:4000", api_key=os.getenv(
-            "LITELLM_API_KEY"))["data"][0]["embedding"]
 
-        vectors.append(vec)
+def build_index(chunks, embed_model="text-embedding-ada-002", batch_size=64, max_concurrency=4,
+                kind=None, compression=None):
+    """
+    Embed chunks (batched, concurrent, cached) and store in a FAISS index.
+    `kind`/`compression` pick the index type (see ann_index.make_index).
+    With no chunks (e.g. a PDF without extractable text) the index is None.
+    """
+    chunks = list(chunks)
+    if not chunks:
+        return None, chunks
+    vectors = get_engine(embed_model).embed(chunks, batch_size=batch_size, max_concurrency=max_concurrency)
 
-    dim = len(vectors[0])
-    index = faiss.IndexFlatL2(dim)
-    index.add(np.array(vectors).astype("float32"))
-    return index, chunks
+    return build_ann_index(vectors, kind, compression), chunks
 
 
 def retrieve(query, index, chunks, embed_model="text-embedding-ada-002", k=3):
     """Return top-k relevant chunkls for query."""
-
-    q_vec = embedding(model=embed_model, input=query, api_base="http://localhost:4000", api_key=os.getenv(
-        "LITELLM_API_KEY"))["data"][0]["embedding"]
-
-    D, I = index.search(np.array([q_vec]).astype("float32"), k)
-    return [chunks[i] for i in I[0]]
-
-
-def run_agent(query, context_chunks, model="gpt-4.1-mini"):
-    """Use LiteLLM to answer based on retrieved chunks."""
-    context = "\n\n".join(context_chunks)
+    if index is None or index.ntotal == 0:
+        return []
+
+    q_vec = get_engine(embed_model).embed([query])
+
+    D, I = index.search(q_vec, k)
+    return [chunks[i] for i in I[0] if i != -1]
+
+
+def run_agent(query, context_chunks, model="gpt-4.1-mini", budget=None, stats=None):
+    """
+    Use LiteLLM to answer based on retrieved chunks (most relevant first).
+    Overlapping chunk windows are de-duplicated and the context is packed
+    into `budget` tokens (CONTEXT_TOKEN_BUDGET by default); `stats`, if
+    given, receives the packer's token report.
+    """
+    packed = pack_context([{"text": c} for c in context_chunks], model, budget)
+    if stats is not None:
+        stats.update(packed.report())
+    context = packed.text
     system_prompt = (
         "You are a helpful assistant. Answer the question using ONLY the context below.\n\n"
         f"Context:\n{context}\n\n"
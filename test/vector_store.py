@@ -0,0 +1,206 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import faiss
+import numpy as np
+from ann_index import make_index
+from embeddings import get_engine, text_hash
+
+STORE_DIR = os.path.join("cache", "store")
+
+
+class VectorStore:
+    """
+    One long-lived store for many documents.
+
+    Vectors live in a FAISS IndexIDMap2 keyed by chunk row id, and chunk
+    text plus document/project metadata live in SQLite, so adding,
+    replacing or deleting a document only touches that document's vectors
+    (deleted vectors are compacted out, so search cost follows the live
+    corpus). Searches can be restricted to documents or a project with an
+    IDSelectorBatch. `compression` ("none", "fp16", "int8") picks the flat
+    storage under the ID map; graph/IVF indexes are not used here because
+    they do not support cheap removal. int8 takes its per-dimension value
+    ranges from the first batch of vectors the store sees (saved with the
+    index); later vectors outside them are clipped.
+    """
+
+    COMPRESSIONS = ("none", "fp16", "int8")
+
+    def __init__(self, root: str = STORE_DIR, embed_model="text-embedding-ada-002", compression="none"):
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"unknown store compression {compression!r}; expected one of {self.COMPRESSIONS}")
+        self.root = root
+        self.embed_model = embed_model
+        self.compression = compression
+        self.index_path = os.path.join(root, "vectors.faiss")
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(root, "meta.sqlite"), check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_id TEXT PRIMARY KEY, project TEXT, name TEXT, content_hash TEXT,"
+            " n_chunks INTEGER, updated_at REAL);"
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, project TEXT, ord INTEGER,"
+            " page_start INTEGER, page_end INTEGER, section TEXT, text TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id);"
+            "CREATE INDEX IF NOT EXISTS chunks_project ON chunks (project);")
+        self._conn.commit()
+        self.index = self._load_index()
+
+    # --- persistence ---
+
+    def _load_index(self):
+        if os.path.exists(self.index_path):
+            index = faiss.read_index(self.index_path)
+            (n_rows,) = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()
+            if index.ntotal == n_rows:
+                return index
+        return self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Re-create the vectors from SQLite (the embedding cache makes this cheap) after a crash."""
+        rows = self._conn.execute("SELECT id, text FROM chunks ORDER BY id").fetchall()
+        if not rows:
+            return None
+        vectors = get_engine(self.embed_model).embed([text for _, text in rows])
+        index = self._new_index(vectors)
+        index.add_with_ids(vectors, np.array([i for i, _ in rows], dtype="int64"))
+        self._save_index(index)
+        return index
+
+    def _new_index(self, vectors):
+        """Empty ID-mapped index for vectors like these, trained on them if the storage needs it (int8)."""
+        index = make_index(vectors.shape[1], len(vectors), "flat", self.compression)
+        if not index.is_trained:
+            index.train(vectors)
+        return faiss.IndexIDMap2(index)
+
+    def _save_index(self, index):
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".vectors-")
+        os.close(fd)
+        faiss.write_index(index, tmp)
+        os.replace(tmp, self.index_path)
+
+    # --- documents ---
+
+    def documents(self, project: str = None):
+        sql = "SELECT doc_id, project, name, n_chunks, updated_at FROM documents"
+        args = []
+        if project is not None:
+            sql += " WHERE project = ?"
+            args.append(project)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY updated_at DESC", args).fetchall()
+        return [dict(zip(("doc_id", "project", "name", "n_chunks", "updated_at"), r)) for r in rows]
+
+    def add_document(self, doc_id: str, chunks, project: str = None, name: str = None, metas=None, vectors=None):
+        """
+        Add or replace a document. `metas` optionally gives page_start,
+        page_end and section per chunk; `vectors` skips embedding. Returns
+        False when the same content is already stored under `doc_id`.
+        """
+        texts = list(chunks)
+        content_hash = text_hash("\x00".join(texts))
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash, project FROM documents WHERE doc_id = ?",
+                                     (doc_id,)).fetchone()
+            if row is not None and row[0] == content_hash and row[1] == project:
+                return False
+        if vectors is None:
+            vectors = get_engine(self.embed_model).embed(texts)
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        metas = list(metas) if metas is not None else [{}] * len(texts)
+
+        with self._lock:
+            old_ids = self._chunk_ids(doc_id=doc_id)
+            with self._conn:
+                self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                ids = []
+                for ord_, (text, meta) in enumerate(zip(texts, metas)):
+                    cur = self._conn.execute(
+                        "INSERT INTO chunks (doc_id, project, ord, page_start, page_end, section, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (doc_id, project, ord_, meta.get("page_start"), meta.get("page_end"),
+                         meta.get("section"), text))
+                    ids.append(cur.lastrowid)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO documents (doc_id, project, name, content_hash, n_chunks, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (doc_id, project, name or doc_id, content_hash, len(texts), time.time()))
+            if self.index is None and len(texts):
+                self.index = self._new_index(vectors)
+            if self.index is not None:
+                if old_ids:
+                    self.index.remove_ids(faiss.IDSelectorBatch(np.array(old_ids, dtype="int64")))
+                if ids:
+                    self.index.add_with_ids(vectors, np.array(ids, dtype="int64"))
+                self._save_index(self.index)
+        return True
+
+    def delete_document(self, doc_id: str) -> bool:
+        with self._lock:
+            ids = self._chunk_ids(doc_id=doc_id)
+            with self._conn:
+                cur = self._conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+                self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            if ids and self.index is not None:
+                self.index.remove_ids(faiss.IDSelectorBatch(np.array(ids, dtype="int64")))
+                self._save_index(self.index)
+            return cur.rowcount > 0
+
+    def _chunk_ids(self, doc_id: str = None, doc_ids=None, project: str = None):
+        clauses, args = [], []
+        if doc_id is not None:
+            doc_ids = [doc_id]
+        if doc_ids is not None:
+            clauses.append(f"doc_id IN ({','.join('?' * len(doc_ids))})")
+            args += list(doc_ids)
+        if project is not None:
+            clauses.append("project = ?")
+            args.append(project)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return [r[0] for r in self._conn.execute(f"SELECT id FROM chunks{where}", args)]
+
+    # --- search ---
+
+    def search(self, query: str, k: int = 3, doc_ids=None, project: str = None):
+        """Top-k chunks as dicts (text, doc_id, project, page_start, page_end, section, distance)."""
+        q_vec = np.ascontiguousarray(get_engine(self.embed_model).embed([query]), dtype="float32")
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return []
+            params = None
+            if doc_ids is not None or project is not None:
+                allowed = self._chunk_ids(doc_ids=doc_ids, project=project)
+                if not allowed:
+                    return []
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(allowed, dtype="int64")))
+            D, I = self.index.search(q_vec, k, params=params)
+            hits = [(int(i), float(d)) for i, d in zip(I[0], D[0]) if i != -1]
+            if not hits:
+                return []
+            marks = ",".join("?" * len(hits))
+            rows = self._conn.execute(
+                f"SELECT id, text, doc_id, project, page_start, page_end, section FROM chunks WHERE id IN ({marks})",
+                [i for i, _ in hits]).fetchall()
+        by_id = {r[0]: r[1:] for r in rows}
+        fields = ("text", "doc_id", "project", "page_start", "page_end", "section")
+        return [{**dict(zip(fields, by_id[i])), "distance": d} for i, d in hits if i in by_id]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store(embed_model="text-embedding-ada-002") -> VectorStore:
+    """Process-wide store shared by every session."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VectorStore(embed_model=embed_model,
+                                 compression=os.getenv("RAG_STORE_COMPRESSION", "none"))
+        return _store